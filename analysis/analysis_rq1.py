@@ -1,19 +1,17 @@
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import analysis.data_modelling as dm
+import analysis.date_index as di
+import analysis.figures as figures
 
+# Forecast error columns are derived once on the shared data set (dm.add_derived_columns),
+# this only adds them when they are missing, so no copy of the data set is made
 def prep_data(df):
-
-    cols = ['date', 'product_id', 'warehouse_id', 'supplier_id',
-            'region', 'units_sold', 'promotion_flag', 'demand_forecast']
-    df = df[cols].copy()
-
-
-    df['difference'] = df['units_sold'] - df['demand_forecast']
-    df['abs_difference'] = abs(df['difference'])
-    
-
-    df['promo_label'] = df['promotion_flag'].map({0: 'No Promotion', 1: 'Promotion'})
+    if 'abs_difference' not in df.columns:
+        df = dm.add_derived_columns(df)
 
     return df
 
@@ -22,15 +20,81 @@ def create_static_line_chart(df):
     df_grouped = df.groupby('date', as_index=False)[['units_sold', 'demand_forecast']].sum()
     df_grouped = df_grouped.sort_values(by='date')
 
-    fig = px.line(df_grouped, x='date', y=['units_sold', 'demand_forecast'],
-                  title='Total Company Sales vs. Demand Forecast')    
-    
-    return fig
+    return plot_sales_vs_forecast(df_grouped)
+
+# Line chart of daily units_sold and demand_forecast (columns date, units_sold, demand_forecast).
+# With max_points, each line is downsampled on the server to at most that many points (LTTB),
+# so long histories don't send every day to the browser
+def plot_sales_vs_forecast(df_daily, title='Total Company Sales vs. Demand Forecast', max_points=None):
+    if max_points is None or len(df_daily) <= max_points:
+        return px.line(df_daily, x='date', y=['units_sold', 'demand_forecast'], title=title)
+
+    lines = []
+    for column in ['units_sold', 'demand_forecast']:
+        kept = figures.lttb(df_daily['date'], df_daily[column], max_points)
+        lines.append(pd.DataFrame({'date': df_daily['date'].to_numpy()[kept], 'variable': column,
+                                   'value': df_daily[column].to_numpy()[kept]}))
+
+    return px.line(pd.concat(lines, ignore_index=True), x='date', y='value', color='variable', title=title)
+
+# Daily units_sold and demand_forecast per (warehouse, region) dropdown pair, including 'All' rollups,
+# as prefix sums over the days: each array has shape (days + 1, 3) with cumulative units_sold,
+# demand_forecast and number of values, so a day range of any pair is one subtraction
+@dataclass
+class SalesForecastSeries:
+    days: np.ndarray
+    cumulative: dict
+
+# Built from di.PrefixSums of units_sold and demand_forecast per (warehouse_id, region)
+def build_sales_forecast_series(prefix_sums):
+    columns = prefix_sums.columns
+    position = {column: i for i, column in enumerate(columns)}
+    # a few hundred warehouse/region pairs, so the totals before every day fit in one array
+    totals = prefix_sums.dense_cumulative()
+    cumulative = np.stack([
+        totals[:, :, position[('units_sold', 'sum')]],
+        totals[:, :, position[('demand_forecast', 'sum')]],
+        totals[:, :, position[('units_sold', 'count')]] + totals[:, :, position[('demand_forecast', 'count')]],
+    ], axis=-1)
+
+    warehouses = prefix_sums.groups.get_level_values('warehouse_id').to_numpy()
+    regions = prefix_sums.groups.get_level_values('region').to_numpy()
+
+    # cumulative sums add up, so a rollup is the sum of the cumulative arrays of its pairs
+    series = {('All Warehouses', 'All Regions'): cumulative.sum(axis=1)}
+    for warehouse in pd.unique(warehouses):
+        series[(warehouse, 'All Regions')] = cumulative[:, warehouses == warehouse].sum(axis=1)
+    for region in pd.unique(regions):
+        series[('All Warehouses', region)] = cumulative[:, regions == region].sum(axis=1)
+    for group, (warehouse, region) in enumerate(zip(warehouses, regions)):
+        series[(warehouse, region)] = cumulative[:, group]
+
+    return SalesForecastSeries(days=prefix_sums.index.days, cumulative=series)
+
+# Daily totals of one dropdown pair between start_date and end_date, in the format of create_static_line_chart.
+# Days without values for the pair are left out, like in a groupby of the filtered rows.
+# Differences of cumulative sums carry float noise, so totals are rounded to the precision of the data:
+# whole units sold, and demand_forecast with FORECAST_DECIMALS decimals
+FORECAST_DECIMALS = 2
+
+def get_sales_vs_forecast(series, warehouse, region, start_date=None, end_date=None):
+    cumulative = series.cumulative.get((warehouse, region))
+    days = di.slice_sorted(series.days, start_date, end_date)
+    if cumulative is None:
+        return pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'), 'units_sold': [], 'demand_forecast': []})
+
+    daily = cumulative[days.start + 1:days.stop + 1] - cumulative[days.start:days.stop]
+    has_values = daily[:, 2] > 0
+    return pd.DataFrame({
+        'date': series.days[days][has_values].astype('datetime64[ns]'),
+        'units_sold': np.rint(daily[has_values, 0]).astype(np.int64),
+        'demand_forecast': daily[has_values, 1].round(FORECAST_DECIMALS),
+    })
 
 #Helper function for the callback
 def filter_dataframe(df, warehouse, region):
-    df_temp = df.copy()
-    
+    df_temp = df  # masks below return new frames, so no copy is needed
+
     if warehouse != 'All Warehouses':
         df_temp = df_temp[df_temp['warehouse_id'] == warehouse]
 
@@ -39,10 +103,49 @@ def filter_dataframe(df, warehouse, region):
 
     return df_temp
 
+# Forecast error per (warehouse, region) dropdown pair, including 'All' rollups
+# Each value is a Series of summed abs_difference indexed by product_id
+def build_forecast_error_table(df):
+    errors = df.groupby(['warehouse_id', 'region', 'product_id'], observed=True)['abs_difference'].sum()
+    return build_forecast_error_table_from_sums(errors)
+
+# Same as build_forecast_error_table, from abs_difference already summed per
+# (warehouse_id, region, product_id), e.g. the 'forecast_error' aggregate of dm.aggregate_chunk
+def build_forecast_error_table_from_sums(errors):
+    errors = errors.rename('abs_difference')
+
+    rollups = {
+        ('warehouse_id', 'region'): lambda warehouse, region: (warehouse, region),
+        ('warehouse_id',): lambda warehouse: (warehouse, 'All Regions'),
+        ('region',): lambda region: ('All Warehouses', region),
+    }
+
+    table = {}
+    for levels, make_key in rollups.items():
+        rolled_up = errors.groupby(level=list(levels) + ['product_id'], observed=True).sum()
+        for key, product_errors in rolled_up.groupby(level=list(levels), observed=True):
+            key = key if isinstance(key, tuple) else (key,)
+            table[make_key(*key)] = product_errors.droplevel(list(levels))
+
+    table[('All Warehouses', 'All Regions')] = errors.groupby(level='product_id').sum()
+    return table
+
+# Top 10 errors for one dropdown pair, from the precomputed table
+def get_worst_performing(error_table, warehouse, region, n=10):
+    product_errors = error_table.get((warehouse, region))
+    if product_errors is None:
+        return pd.DataFrame({'product_id': [], 'abs_difference': []})
+
+    return product_errors.nlargest(n).rename_axis('product_id').reset_index()
+
 # Top 10 errors
 def create_worst_performing_chart(df_filtered):
     df_ranked = df_filtered.groupby('product_id', as_index=False)['abs_difference'].sum()
     df_ranked = df_ranked.sort_values(by='abs_difference', ascending=False).head(10)
+    return plot_worst_performing(df_ranked)
+
+def plot_worst_performing(df_ranked):
+    df_ranked = df_ranked.copy()
     df_ranked['product_id'] = df_ranked['product_id'].astype(str)  #otherwise plt draws a continuous number line on the X-axis
 
     fig = px.bar(df_ranked, x='product_id', y='abs_difference',
@@ -53,9 +156,15 @@ def create_worst_performing_chart(df_filtered):
     return fig
 
 # Box plot
-def create_promo_box_plot(df_filtered):
-    fig = px.box(df_filtered, x="promo_label", y="difference", color="promo_label",
-                 title="Distribution of Forecast Errors (Bias)")
+# aggregate=True computes the boxes on the server, so the figure doesn't carry every row
+def create_promo_box_plot(df_filtered, aggregate=False):
+    if aggregate:
+        stats = figures.compute_box_stats(df_filtered, "promo_label", "difference")
+        fig = figures.plot_box_stats(stats, "promo_label", title="Distribution of Forecast Errors (Bias)",
+                                     labels={"x": "promo_label", "y": "difference"}, color_by_group=True)
+    else:
+        fig = px.box(df_filtered, x="promo_label", y="difference", color="promo_label",
+                     title="Distribution of Forecast Errors (Bias)")
     
     fig.update_layout(plot_bgcolor="white", showlegend=False)
     fig.update_yaxes(gridcolor='#eee', zeroline=True)
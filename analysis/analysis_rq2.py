@@ -1,33 +1,119 @@
+from dataclasses import dataclass
+
 import analysis.data_modelling as dm
+import numpy as np
 import pandas as pd
 import plotly.express as px
 
 # DATA PREPARATION
 def prepare_promotion_data(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    # Promotion labels and profit are derived once on the shared data set (dm.add_derived_columns),
+    # this only adds them when they are missing, so no copy of the data set is made
+    if "profit" not in df.columns:
+        df = dm.add_derived_columns(df)
 
-    # Label promotions
-    df["promotion_flag"] = df["promotion_flag"].map(
-        {0: "No Promotion", 1: "Promotion"}
-    )
+    return df
 
-    # Calculate profit
-    df["profit"] = (df["unit_price"] - df["unit_cost"]) * df["units_sold"]
 
-    return df
+# PROMOTION CUBE
+# Sums and counts of units sold and profit per promotion flag, region, warehouse and month, built from
+# the running 'promotions' aggregate (dm.STREAM_AGGREGATES). Every region/warehouse/month filter is
+# answered by adding up a slice of the cube instead of grouping the data set again.
+# values has shape (PROMOTION_MEASURES, 2 flags, regions, warehouses, 13 months):
+# month 1 is on position 1, position 0 holds rows without a valid date
+PROMOTION_MEASURES = ["units_sold_sum", "units_sold_count", "profit_sum", "profit_count", "rows"]
+
+
+@dataclass
+class PromotionCube:
+    regions: list
+    warehouses: list
+    values: np.ndarray
+
+
+def build_promotion_cube(sums: pd.DataFrame) -> PromotionCube:
+    keys = sums.index.to_frame(index=False)
+    regions = sorted(keys["region"].dropna().unique().tolist())
+    warehouses = sorted(keys["warehouse_id"].dropna().unique().tolist())
+
+    # positions on the axes of the cube, rows without a promotion flag are left out like in the groupbys below
+    flags = keys["promotion_flag"].to_numpy(dtype=float, na_value=np.nan)
+    region_positions = pd.Index(regions).get_indexer(keys["region"]).astype(np.int64)
+    warehouse_positions = pd.Index(warehouses).get_indexer(keys["warehouse_id"]).astype(np.int64)
+    months = keys["month"].to_numpy(dtype=float, na_value=0)
+    month_positions = np.where((months >= 1) & (months <= 12), months, 0).astype(np.int64)
+
+    valid = np.isin(flags, [0, 1]) & (region_positions >= 0) & (warehouse_positions >= 0)
+    flat_positions = (
+        (flags[valid].astype(np.int64) * len(regions) + region_positions[valid]) * len(warehouses)
+        + warehouse_positions[valid]
+    ) * 13 + month_positions[valid]
+
+    columns = [
+        ("units_sold", "sum"), ("units_sold", "count"), ("profit", "sum"), ("profit", "count"),
+        ("promotion_flag", "count"),
+    ]
+    size = 2 * len(regions) * len(warehouses) * 13
+    values = np.stack([
+        np.bincount(flat_positions, weights=sums[column].to_numpy(dtype=float, na_value=0)[valid], minlength=size)
+        for column in columns
+    ]).reshape(len(PROMOTION_MEASURES), 2, len(regions), len(warehouses), 13)
+
+    return PromotionCube(regions=regions, warehouses=warehouses, values=values)
+
+
+def select_promotions(cube: PromotionCube, regions=None, warehouses=None, month_from: int = 1,
+                      month_to: int = 12) -> np.ndarray:
+    # sums per measure, flag and region for the selection, shape (PROMOTION_MEASURES, 2, regions).
+    # No regions or warehouses selected means all of them. Rows without a date only count when the
+    # whole year is selected, like the RQ5 month filter
+    month_mask = np.zeros(13, dtype=bool)
+    month_mask[month_from:month_to + 1] = True
+    month_mask[0] = month_from <= 1 and month_to >= 12
+
+    values = cube.values[..., month_mask]
+    if warehouses:
+        values = values[:, :, :, np.isin(cube.warehouses, list(warehouses))]
+    selected = values.sum(axis=(3, 4))
+
+    if regions:
+        selected[:, :, ~np.isin(cube.regions, list(regions))] = 0
+    return selected
+
+
+def get_promotion_averages(selected: np.ndarray) -> pd.DataFrame:
+    # same data as df.groupby("promo_label").mean() of units_sold and profit, from select_promotions
+    units_sold_sum, units_sold_count, profit_sum, profit_count, rows = selected.sum(axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        averages = pd.DataFrame({
+            "promo_label": [dm.PROMOTION_LABELS[flag] for flag in (0, 1)],
+            "units_sold": np.where(units_sold_count > 0, units_sold_sum / units_sold_count, np.nan),
+            "profit": np.where(profit_count > 0, profit_sum / profit_count, np.nan),
+        })
+    return averages[rows > 0].reset_index(drop=True)
+
+
+def get_promotions_by_region(cube: PromotionCube, selected: np.ndarray) -> pd.DataFrame:
+    # number of rows with a promotion per region, from select_promotions
+    promotion_rows = selected[PROMOTION_MEASURES.index("rows"), 1]
+    region_promos = pd.DataFrame({"region": cube.regions, "promotion_count": promotion_rows.astype(np.int64)})
+    return region_promos[promotion_rows > 0].reset_index(drop=True)
 
 
 # RQ: Sales impact of promotions
 def plot_avg_units_sold(df: pd.DataFrame):
-    sales_avg = df.groupby("promotion_flag", as_index=False)["units_sold"].mean()
+    sales_avg = df.groupby("promo_label", as_index=False, observed=True)["units_sold"].mean()
+    return plot_avg_units_sold_from_averages(sales_avg)
+
 
+def plot_avg_units_sold_from_averages(sales_avg: pd.DataFrame):
     fig = px.bar(
         sales_avg,
-        x="promotion_flag",
+        x="promo_label",
         y="units_sold",
         title="<b>Average Units Sold: Promotion vs No Promotion</b>",
         labels={
-            "promotion_flag": "Promotion Status",
+            "promo_label": "Promotion Status",
             "units_sold": "Average Units Sold"
         },
         template="plotly_white",
@@ -38,15 +124,18 @@ def plot_avg_units_sold(df: pd.DataFrame):
 
 # RQ: Profit impact of promotions
 def plot_avg_profit(df: pd.DataFrame):
-    profit_avg = df.groupby("promotion_flag", as_index=False)["profit"].mean()
+    profit_avg = df.groupby("promo_label", as_index=False, observed=True)["profit"].mean()
+    return plot_avg_profit_from_averages(profit_avg)
 
+
+def plot_avg_profit_from_averages(profit_avg: pd.DataFrame):
     fig = px.bar(
         profit_avg,
-        x="promotion_flag",
+        x="promo_label",
         y="profit",
         title="<b>Average Profit: Promotion vs No Promotion</b>",
         labels={
-            "promotion_flag": "Promotion Status",
+            "promo_label": "Promotion Status",
             "profit": "Average Profit"
         },
         template="plotly_white",
@@ -58,12 +147,15 @@ def plot_avg_profit(df: pd.DataFrame):
 # RQ: Regional promotion activity
 def plot_promotions_by_region(df: pd.DataFrame):
     region_promos = (
-        df[df["promotion_flag"] == "Promotion"]
-        .groupby("region", as_index=False)
+        df[df["promo_label"] == "Promotion"]
+        .groupby("region", as_index=False, observed=True)
         .size()
         .rename(columns={"size": "promotion_count"})
     )
+    return plot_promotions_by_region_from_counts(region_promos)
+
 
+def plot_promotions_by_region_from_counts(region_promos: pd.DataFrame):
     fig = px.bar(
         region_promos,
         x="region",
@@ -77,3 +169,107 @@ def plot_promotions_by_region(df: pd.DataFrame):
         height=400
     )
     return fig
+
+
+# CONCURRENT PROMOTIONS
+# A promotion of a product in a warehouse runs from the first to the last of consecutive days with
+# promotion_flag 1 (a day with several rows counts as a promotion day if any of them has a promotion).
+# A day without rows ends the promotion, so a gap in the data is not counted as promotion days
+def get_promotion_intervals(df: pd.DataFrame) -> pd.DataFrame:
+    days = df.loc[df["date"].notna() & df["promotion_flag"].notna(),
+                  ["product_id", "warehouse_id", "date", "promotion_flag"]]
+    days = days.groupby(["product_id", "warehouse_id", "date"], sort=True)["promotion_flag"].max().reset_index()
+
+    product_ids = days["product_id"].to_numpy()
+    warehouse_ids = days["warehouse_id"].to_numpy()
+    promoted = days["promotion_flag"].to_numpy(dtype=np.int64) == 1
+
+    # a run starts where the same product and warehouse had no promotion the day before,
+    # and ends where it has none the day after
+    dates = days["date"].to_numpy()
+    next_day = (product_ids[1:] == product_ids[:-1]) & (warehouse_ids[1:] == warehouse_ids[:-1]) & (
+        dates[1:].astype("datetime64[D]") - dates[:-1].astype("datetime64[D]") == np.timedelta64(1, "D")
+    )
+    starts = promoted & ~np.r_[False, promoted[:-1] & next_day]
+    ends = promoted & ~np.r_[promoted[1:] & next_day, False]
+
+    return pd.DataFrame({
+        "product_id": product_ids[starts],
+        "warehouse_id": warehouse_ids[starts],
+        "start": dates[starts],
+        "end": dates[ends],
+    })
+
+
+def count_concurrent_promotions(intervals: pd.DataFrame, first_date=None, last_date=None) -> pd.DataFrame:
+    # sweep line: +1 on the first day of every interval, -1 on the day after its last day.
+    # Sorting the 2n events is O(n log n), the running sum after the last event of each date is
+    # the number of promotions running from that date on
+    first_date = intervals["start"].min() if first_date is None else first_date
+    last_date = intervals["end"].max() if last_date is None else last_date
+    if pd.isna(first_date) or pd.isna(last_date):
+        return pd.DataFrame({"date": pd.Series(dtype="datetime64[ns]"), "concurrent_promotions": pd.Series(dtype=np.int64)})
+
+    starts = intervals["start"].to_numpy(dtype="datetime64[D]")
+    ends = intervals["end"].to_numpy(dtype="datetime64[D]") + np.timedelta64(1, "D")
+    event_dates = np.concatenate([starts, ends])
+    order = np.argsort(event_dates, kind="stable")
+    event_dates = event_dates[order]
+    running = np.cumsum(np.r_[np.ones(len(starts), np.int64), -np.ones(len(ends), np.int64)][order])
+    last_of_date = np.ones(len(event_dates), dtype=bool)
+    last_of_date[:-1] = event_dates[1:] != event_dates[:-1]
+    event_dates = event_dates[last_of_date]
+    # no promotions are running before the first event
+    running = np.r_[0, running[last_of_date]]
+
+    # every day takes the count of the last event on or before it
+    days = np.arange(np.datetime64(first_date, "D"), np.datetime64(last_date, "D") + 1)
+    counts = running[np.searchsorted(event_dates, days, side="right")]
+
+    return pd.DataFrame({"date": days.astype("datetime64[ns]"), "concurrent_promotions": counts})
+
+
+def get_concurrent_promotions_distribution(daily: pd.DataFrame) -> pd.DataFrame:
+    # number of days per number of concurrent promotions
+    return (
+        daily["concurrent_promotions"]
+        .value_counts()
+        .sort_index()
+        .rename_axis("concurrent_promotions")
+        .reset_index(name="days")
+    )
+
+
+# RQ: How many product promotions are running at the same time
+def plot_concurrent_promotions(daily: pd.DataFrame):
+    median = daily["concurrent_promotions"].median() if len(daily) else 0
+
+    fig = px.line(
+        daily,
+        x="date",
+        y="concurrent_promotions",
+        title=f"<b>Product Promotions Running at the Same Time (median {median:g} per day)</b>",
+        labels={
+            "date": "Date",
+            "concurrent_promotions": "Running Promotions"
+        },
+        template="plotly_white",
+        height=400
+    )
+    return fig
+
+
+def plot_concurrent_promotions_distribution(distribution: pd.DataFrame):
+    fig = px.bar(
+        distribution,
+        x="concurrent_promotions",
+        y="days",
+        title="<b>Days by Number of Promotions Running at the Same Time</b>",
+        labels={
+            "concurrent_promotions": "Running Promotions",
+            "days": "Number of Days"
+        },
+        template="plotly_white",
+        height=400
+    )
+    return fig
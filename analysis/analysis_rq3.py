@@ -4,13 +4,81 @@ reliable/whose lead times are most consistent? Is there a correlation between su
 and inventory levels?
 """
 
-import analysis.data_modelling as dm
+import analysis.figures as figures
+import numpy as np
 import pandas as pd
 import plotly.express as px
 
+# LEAD TIME STATISTICS PER SUPPLIER
+# Lead times are whole days, so the number of orders per supplier and lead time (a histogram)
+# holds everything the summary needs: the statistics computed from it are exact, not approximations.
+# Histograms of new rows are added to the running totals (STREAM_AGGREGATES["supplier_lead_time"] in data_modelling),
+# and a selection of suppliers only looks up their rows in the result.
+def build_lead_time_stats(counts: pd.Series) -> pd.DataFrame:
+    """
+    Computes lead time statistics per supplier from the number of orders per supplier and lead time.
+    The median interpolates between the two middle orders like pandas, and the standard deviation
+    is the sample standard deviation (NaN for a single order).
+
+    :param counts: number of orders, indexed by supplier_id and supplier_lead_time_days
+    :type counts: pd.Series
+
+    :return: a dataframe indexed by supplier_id with columns mean, median, min, max, std and count
+    """
+    histogram = counts.rename("count").reset_index()
+    histogram.columns = ["supplier_id", "lead_time", "count"]
+    histogram = histogram[histogram["lead_time"].notna() & (histogram["count"] > 0)]
+    histogram = histogram.astype({"lead_time": float, "count": "int64"}).sort_values(["supplier_id", "lead_time"])
+
+    stats = {}
+    for supplier_id, supplier_histogram in histogram.groupby("supplier_id", sort=True):
+        lead_times = supplier_histogram["lead_time"].to_numpy()
+        orders = supplier_histogram["count"].to_numpy()
+        n = orders.sum()
+        mean = (lead_times * orders).sum() / n
+        # deviations from the mean, so large lead times don't lose precision
+        variance = (orders * (lead_times - mean) ** 2).sum() / (n - 1) if n > 1 else np.nan
+        stats[supplier_id] = {
+            "mean": mean,
+            "median": _histogram_quantile(lead_times, orders, 0.5),
+            "min": lead_times[0],
+            "max": lead_times[-1],
+            "std": np.sqrt(variance),
+            "count": n,
+        }
+
+    columns = ["mean", "median", "min", "max", "std", "count"]
+    return pd.DataFrame.from_dict(stats, orient="index", columns=columns).rename_axis("supplier_id")
+
+
+def _histogram_quantile(values: np.ndarray, counts: np.ndarray, q: float) -> float:
+    """
+    Returns the q quantile of sorted values that occur counts times, with linear interpolation
+    """
+    position = q * (counts.sum() - 1)
+    ends = np.cumsum(counts)
+    lower = values[np.searchsorted(ends, np.floor(position), side="right")]
+    upper = values[np.searchsorted(ends, np.ceil(position), side="right")]
+    return lower + (upper - lower) * (position - np.floor(position))
+
+
+def select_suppliers(stats: pd.DataFrame, selected_suppliers: list | None) -> pd.DataFrame:
+    """
+    Returns the statistics of the selected suppliers, or of all suppliers if none are selected
+    """
+    if not selected_suppliers:
+        return stats
+    return stats[stats.index.isin(selected_suppliers)]
+
+
 # RQ3.1: Average Lead Time by Supplier
 def plot_avg_lead_time(df: pd.DataFrame):
-    avg_df = df.groupby("supplier_id", as_index=False)["supplier_lead_time_days"].mean()
+    stats = df.groupby("supplier_id")["supplier_lead_time_days"].mean().to_frame("mean")
+    return plot_avg_lead_time_from_stats(stats)
+
+
+def plot_avg_lead_time_from_stats(stats: pd.DataFrame):
+    avg_df = stats["mean"].rename("supplier_lead_time_days").reset_index()
     avg_df["supplier_id"] = avg_df["supplier_id"].astype(str) # converting it to string to make it a category
     
     bar_fig = px.bar(
@@ -28,9 +96,23 @@ def plot_avg_lead_time(df: pd.DataFrame):
     return bar_fig
 
 # RQ3.2: Lead Time Distribution by Supplier
-def plot_lead_time_box(df: pd.DataFrame):
+# aggregate=True computes the boxes on the server, so the figure doesn't carry every row
+def plot_lead_time_box(df: pd.DataFrame, aggregate: bool = False):
+    supplier_order = sorted(df["supplier_id"].unique())
+
+    if aggregate:
+        stats = figures.compute_box_stats(df, "supplier_id", "supplier_lead_time_days")
+        box_fig = figures.plot_box_stats(
+            stats,
+            "supplier_id",
+            title="<b>Lead Time Distribution by Supplier</b>",
+            labels={"x": "Supplier ID", "y": "Lead Time (days)"},
+            category_order=supplier_order,
+        )
+        box_fig.update_layout(template="plotly_white", height=450)
+        return box_fig
+
     df_plot = df.copy()
-    supplier_order = sorted(df_plot["supplier_id"].unique())
     df_plot["supplier_id"] = df_plot["supplier_id"].astype(str)
     
     box_fig = px.box(
@@ -50,9 +132,12 @@ def plot_lead_time_box(df: pd.DataFrame):
 
 # SUMMARY TABLE
 def supplier_summary_table(df: pd.DataFrame):
-    summary = (
-        df.groupby("supplier_id")["supplier_lead_time_days"].agg(["mean", "median", "min", "max", "std", "count"]).reset_index()
-    )
+    counts = df.groupby(["supplier_id", "supplier_lead_time_days"]).size()
+    return supplier_summary_table_from_stats(build_lead_time_stats(counts))
+
+
+def supplier_summary_table_from_stats(stats: pd.DataFrame):
+    summary = stats[["mean", "median", "min", "max", "std", "count"]].reset_index()
     summary.columns = [
         "Supplier ID",
         "Average Lead Time (Days)",
@@ -69,10 +154,10 @@ def plot_lead_time_vs_inventory(df: pd.DataFrame):
     inv_df =df.groupby("supplier_id", as_index=False).agg(
             avg_lead_time=("supplier_lead_time_days", "mean"),
             avg_inventory=("inventory_level", "mean")
-        )
+        ).round(2)
 
     scatter_fig = px.scatter(
-        inv_df.round(2),
+        inv_df,
         x="avg_lead_time",
         y="avg_inventory",
         text="supplier_id",
@@ -81,10 +166,13 @@ def plot_lead_time_vs_inventory(df: pd.DataFrame):
             "avg_lead_time": "Average Lead Time (days)",
             "avg_inventory": "Average Inventory Level"
         },
-        trendline="ols",
         template="plotly_white",
         height=450
     )
+    # OLS trendline computed with numpy (figures.linear_fit), plotly's trendline="ols" needs statsmodels
+    figures.add_trendline(
+        scatter_fig, inv_df["avg_lead_time"], inv_df["avg_inventory"], "avg_lead_time", "avg_inventory"
+    )
     scatter_fig.update_traces(
         textposition="top center",
         marker=dict(size=10)
@@ -6,16 +6,82 @@ Babak - Inventory/replenishment.
 
 """
 
+from dataclasses import dataclass
+
 import numpy as np
 import pandas as pd
 import plotly.express as px
 
-def plot_inventory_vs_sales_time(df: pd.DataFrame, product_id: str, warehouse_id: str):
+import analysis.date_index as di
+
+
+@dataclass
+class InventoryIndex:
+    """
+    Date-sorted rows for every (product_id, warehouse_id) pair, stored next to each other.
+    offsets maps (product_id, warehouse_id) to the (start, stop) rows of that pair in data.
+    """
+
+    data: pd.DataFrame
+    offsets: dict
+
+    def lookup(self, product_id, warehouse_id, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Returns the rows of one product at one warehouse as a slice of data, without copying.
+        With start_date or end_date, only the rows of that date range (found by binary search in the block).
+        """
+        start, stop = self.offsets.get((product_id, warehouse_id), (0, 0))
+        if start_date is not None or end_date is not None:
+            days = di.slice_sorted(self.data["date"].to_numpy()[start:stop], start_date, end_date)
+            start, stop = start + days.start, start + days.stop
+        return self.data.iloc[start:stop]
+
+
+def build_inventory_index(df: pd.DataFrame) -> InventoryIndex:
+    """
+    Sorts the time series columns by product, warehouse and date once,
+    so each product/warehouse series is a contiguous block of rows.
+    """
+    data = df[["product_id", "warehouse_id", "date", "units_sold", "inventory_level"]].sort_values(
+        ["product_id", "warehouse_id", "date"], kind="stable"
+    ).reset_index(drop=True)
+
+    product_ids = data["product_id"].to_numpy()
+    warehouse_ids = data["warehouse_id"].to_numpy()
+
+    # a new block starts on every row where product or warehouse differs from the row before
+    is_block_start = np.ones(len(data), dtype=bool)
+    is_block_start[1:] = (product_ids[1:] != product_ids[:-1]) | (warehouse_ids[1:] != warehouse_ids[:-1])
+    starts = np.flatnonzero(is_block_start)
+    stops = np.append(starts[1:], len(data))
+
+    offsets = {
+        (product_id, warehouse_id): (start, stop)
+        for product_id, warehouse_id, start, stop in zip(
+            product_ids[starts].tolist(), warehouse_ids[starts].tolist(), starts.tolist(), stops.tolist()
+        )
+    }
+    return InventoryIndex(data=data[["date", "units_sold", "inventory_level"]], offsets=offsets)
+
+
+def plot_inventory_vs_sales_time(
+    df: pd.DataFrame,
+    product_id: str,
+    warehouse_id: str,
+    index: InventoryIndex | None = None,
+    start_date=None,
+    end_date=None,
+):
     """
     Are inventory levels aligned with sales demand?
     Shows units_sold and inventory_level over time for one product at one warehouse.
+    When index from build_inventory_index is given, the series is looked up there instead of scanning df,
+    limited to start_date - end_date when they are given (df is expected to be limited already).
     """
-    data = df[(df["product_id"] == product_id) & (df["warehouse_id"] == warehouse_id)].copy()
+    if index is not None:
+        data = index.lookup(product_id, warehouse_id, start_date, end_date)
+    else:
+        data = df[(df["product_id"] == product_id) & (df["warehouse_id"] == warehouse_id)].copy()
 
     if data.empty:
         # Return empty fig, without trashing
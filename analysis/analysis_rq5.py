@@ -1,9 +1,33 @@
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
-import dash
-from dash import dcc, html
-import dash_bootstrap_components as dbc
+from dash import dcc
 import plotly.express as px
-import analysis.data_modelling as dm
+
+def _sum_units_sold_per_product(
+    df: pd.DataFrame, product_ids: list, column_name: str
+) -> pd.Series:
+    """
+    Sums units sold per product and value of another column, for selected products only.
+
+    :param df: a dataframe with supply chain data set
+    :type df: pd.DataFrame
+
+    :param product_ids: product IDs to include
+    :type product_ids: list
+
+    :param column_name: column to group by next to product_id, e.g. region or month
+    :type column_name: str
+
+    :return: a series with units sold, indexed by (product_id, column_name)
+    """
+
+    # isin uses a hash lookup for the whole column at once,
+    # instead of checking the list of products for every row
+    rows = df[df["product_id"].isin(product_ids)]
+    return rows.groupby(["product_id", column_name], sort=False, observed=True)["units_sold"].sum()
+
 
 def get_top_n_products_sold(df: pd.DataFrame, number_of_products: int) -> pd.DataFrame:
     """
@@ -20,42 +44,21 @@ def get_top_n_products_sold(df: pd.DataFrame, number_of_products: int) -> pd.Dat
     """
 
     # Pseudo code
-    # Define column names and get position of each column in the data set so data can be retrieved later
-    # Create empty dictionary for units_sold_per_product
-    # Go line by line through the data set
-    # For each line, use column product_id as dictionary key, and column units_sold as value (int)
-    # If units_sold_per_product dictionary doesn't have the key yet, add it with units_sold = 0
-    # Add value from units_sold column, to the value already in units_sold_per_product dictionary
+    # Sum units_sold per product_id in one columnar groupby (no row-by-row loop over df.values)
+    # Order the result by units_sold descending
 
     # define column names
     column_product_id_name = "product_id"
     column_units_sold_name = "units_sold"
 
-    # df.values cannot be used in combination with string column names to get values from the row
-    # use get_loc to get index of each column
-    column_product_id_index = df.columns.get_loc(column_product_id_name)
-    column_units_sold_index = df.columns.get_loc(column_units_sold_name)
-
-    # empty dictionary for sale statistics
-    units_sold_per_product_dict = dict()
-
-    # go through all rows - df.values sets row to be list of values in that row
-    for row in df.values:
-        product_id = row[column_product_id_index]
-        units_sold = row[column_units_sold_index]
-
-        # if product_id already exists in dictionary, add up the units sold
-        if product_id in units_sold_per_product_dict:
-            units_sold_per_product_dict[product_id] += units_sold
-        else:
-            units_sold_per_product_dict[product_id] = units_sold
-
-    # from the dictionary, create a pandas df that has a column with product_id and a column with units_sold
-    # order the df by units_sold descending
-    units_sold_per_product_df = pd.DataFrame(
-        units_sold_per_product_dict.items(),
-        columns=[column_product_id_name, column_units_sold_name],
-    ).sort_values(by=column_units_sold_name, ascending=False)
+    # sort=False keeps products in order of first appearance in the data set,
+    # so products with the same units_sold are ranked the same way as before
+    units_sold_per_product_df = (
+        df.groupby(column_product_id_name, sort=False)[column_units_sold_name]
+        .sum()
+        .reset_index()
+        .sort_values(by=column_units_sold_name, ascending=False)
+    )
 
     # take first number_of_products items
     units_sold_per_product_df = units_sold_per_product_df.head(number_of_products)
@@ -101,24 +104,16 @@ def get_sale_performance_for_products_across_regions(
     """
 
     # Pseudo code
-    # Define column names and get position of each column in the data set so data can be retrieved later
     # Create list of product IDs to check, from products_to_include
     # Create a dictionary with product IDs where key is product ID, and value is dictionary with all regions and sales in those regions
-    # Go through the data set, line by line. Skip lines with product that is not in list of included products.
-    # For each line, use column region to get the region, and units_sold as value (int)
-    # Add value from units_sold column to the dictionary
+    # Sum units_sold per product and region in one columnar groupby over the rows of included products
+    # Add the sums to the dictionary
 
     # define column names
     column_product_id_name = "product_id"
     column_units_sold_name = "units_sold"
     column_region_name = "region"
 
-    # df.values cannot be used in combination with string column names to get values from the row
-    # use get_loc to get index of each column
-    column_product_id_index = df.columns.get_loc(column_product_id_name)
-    column_units_sold_index = df.columns.get_loc(column_units_sold_name)
-    column_region_index = df.columns.get_loc(column_region_name)
-
     # get list of products to include - only use keys from the dictionary,
     # units_sold is not needed (it is total units sold)
     product_ids_to_include = products_to_include[column_product_id_name].unique().tolist()
@@ -133,17 +128,10 @@ def get_sale_performance_for_products_across_regions(
         perf_per_region_dict[product_id] = product_dictionary
 
     # count units sold per region
-    for row in df.values:
-        # get all necessary values from the row
-        product_id = row[column_product_id_index]
-        units_sold = row[column_units_sold_index]
-        region = row[column_region_index]
-
-        # skip products that are not most sold
-        if product_id not in product_ids_to_include:
-            continue
-
-        # add units sold to sales for region
+    units_sold_per_region = _sum_units_sold_per_product(
+        df, product_ids_to_include, column_region_name
+    )
+    for (product_id, region), units_sold in units_sold_per_region.items():
         perf_per_region_dict[product_id][region] += units_sold
 
     return perf_per_region_dict
@@ -185,7 +173,7 @@ def plot_sale_performance_for_products_across_regions(
 
     return fig
 
-def get_month_range_filter_selector(from_month: int, to_month: int):
+def get_month_range_filter_selector(from_month: int, to_month: int, selector_id: str = "rq5_months_filter"):
     """
     Gets selector for month range
 
@@ -195,6 +183,9 @@ def get_month_range_filter_selector(from_month: int, to_month: int):
     :param to_month: month to start end
     :type to_month: int
 
+    :param selector_id: id of the selector in the layout
+    :type selector_id: str
+
     :return: filter selector
     """
 
@@ -215,7 +206,7 @@ def get_month_range_filter_selector(from_month: int, to_month: int):
 
     # https://dash.plotly.com/dash-core-components/rangeslider
     return dcc.RangeSlider(
-        id="rq5_months_filter", min=1, max=12, step=1, value=[from_month, to_month], marks=MonthNames
+        id=selector_id, min=1, max=12, step=1, value=[from_month, to_month], marks=MonthNames
     )
 
 
@@ -243,24 +234,15 @@ def get_demand_per_month(
     """
     
     # Pseudo code
-    # Define column names and get position of each column in the data set so data can be retrieved later
     # Create list of product IDs to check, from products_to_include
     # Create a dictionary with product IDs where key is product ID, and value is dictionary with all months and sales in those months
-    # Go through the data set, line by line. Skip lines with product that is not in list of included products.
-    # For each line, use column date to get the month number, and units_sold as value (int). If month is outside of range, skip the row
-    # Add value from units_sold column to the dictionary
-        
+    # Keep only rows where the month is in range, then sum units_sold per product and month in one columnar groupby
+    # Add the sums to the dictionary
+
     # define column names
     column_product_id_name = "product_id"
-    column_units_sold_name = "units_sold"
     column_date_month_name = "month"
 
-    # df.values cannot be used in combination with string column names to get values from the row
-    # use get_loc to get index of each column
-    column_product_id_index = df.columns.get_loc(column_product_id_name)
-    column_units_sold_index = df.columns.get_loc(column_units_sold_name)
-    column_date_month_index = df.columns.get_loc(column_date_month_name)
-
     # get list of products to include - only use keys from the dictionary,
     # units_sold is not needed (it is total units sold)
     product_ids_to_include = products_to_include[column_product_id_name].unique().tolist()
@@ -274,19 +256,16 @@ def get_demand_per_month(
             product_dictionary[month] = 0
         perf_per_month_dict[product_id] = product_dictionary
 
-    # count units sold per month
-    for row in df.values:
-        product_id = row[column_product_id_index]
-        units_sold = row[column_units_sold_index]
-        month = row[column_date_month_index]
-
-        # skip products that are not most sold
-        if product_id not in product_ids_to_include:
-            continue
+    # only count sales that are between from and to
+    month = df[column_date_month_name]
+    in_month_range = df[(month >= from_month) & (month <= to_month)]
 
-        # only count sales that are between from and to
-        if month >= from_month and month <= to_month:
-            perf_per_month_dict[product_id][month] += units_sold
+    # count units sold per month
+    units_sold_per_month = _sum_units_sold_per_product(
+        in_month_range, product_ids_to_include, column_date_month_name
+    )
+    for (product_id, month), units_sold in units_sold_per_month.items():
+        perf_per_month_dict[product_id][month] += units_sold
 
     return perf_per_month_dict
 
@@ -330,3 +309,199 @@ def plot_demand_per_month(demand_per_month: dict) -> px:
     fig.update_xaxes(dtick=1)
 
     return fig
+
+
+# sales cube shared by all RQ5 callbacks
+@dataclass
+class SalesCube:
+    """
+    Units sold per product, region and month, built once from the data set.
+
+    - product_ids: product on each position of the product axis
+    - regions: region on each position of the region axis
+    - units_sold: array with shape (products, regions, 12), month 1 is on position 0
+    - units_sold_per_region: array with shape (products, regions), includes rows without a valid date
+    - units_sold_per_month: array with shape (products, 12), summed over all regions
+    """
+
+    product_ids: np.ndarray
+    regions: list
+    units_sold: np.ndarray
+    units_sold_per_region: np.ndarray
+    units_sold_per_month: np.ndarray
+
+    def __post_init__(self):
+        self._product_positions = {
+            product_id: position for position, product_id in enumerate(self.product_ids.tolist())
+        }
+
+    def product_position(self, product_id) -> int:
+        """
+        Gets position of a product on the product axis of the cube
+        """
+        return self._product_positions[product_id]
+
+
+def build_sales_cube(df: pd.DataFrame, regions: set[str]) -> SalesCube:
+    """
+    Builds a dense product x region x month cube of units sold.
+    The data set is scanned once, all RQ5 filters are then answered from the cube.
+
+    :param df: a dataframe with supply chain data set
+    :type df: pd.DataFrame
+
+    :param regions: all regions in the data set
+    :type regions: set[str]
+
+    :return: a sales cube
+    """
+
+    # Pseudo code
+    # Turn product_id, region and month into positions on the axes of the cube
+    # Turn the three positions into one flat position and add up units_sold with np.bincount
+    # Reshape the flat result into the cube and precompute sums per region and per month
+
+    region_list = list(regions)
+    n_months = 12
+
+    # factorize keeps products in order of first appearance, like get_top_n_products_sold
+    product_positions, product_ids = pd.factorize(df["product_id"])
+    region_positions = pd.Categorical(df["region"], categories=region_list).codes.astype(np.int64)
+    month_positions = pd.to_numeric(df["month"], errors="coerce").to_numpy(dtype=float, na_value=np.nan) - 1
+    # missing units_sold count as 0
+    units_sold = df["units_sold"].to_numpy(dtype=float, na_value=0)
+
+    n_products = len(product_ids)
+    n_regions = len(region_list)
+
+    # units sold per product and region, for all rows with a known region
+    has_region = region_positions >= 0
+    flat_positions = product_positions[has_region] * n_regions + region_positions[has_region]
+    units_sold_per_region = np.bincount(
+        flat_positions, weights=units_sold[has_region], minlength=n_products * n_regions
+    ).reshape(n_products, n_regions)
+
+    # units sold per product, region and month, for rows that also have a valid month
+    has_month = has_region & (month_positions >= 0) & (month_positions < n_months)
+    flat_positions = (
+        product_positions[has_month] * n_regions + region_positions[has_month]
+    ) * n_months + month_positions[has_month].astype(np.int64)
+    cube = np.bincount(
+        flat_positions, weights=units_sold[has_month], minlength=n_products * n_regions * n_months
+    ).reshape(n_products, n_regions, n_months)
+
+    # bincount always adds up as float - go back to integers when units_sold are integers
+    if pd.api.types.is_integer_dtype(df["units_sold"]):
+        cube = cube.round().astype(np.int64)
+        units_sold_per_region = units_sold_per_region.round().astype(np.int64)
+
+    return SalesCube(
+        product_ids=np.asarray(product_ids),
+        regions=region_list,
+        units_sold=cube,
+        units_sold_per_region=units_sold_per_region,
+        units_sold_per_month=cube.sum(axis=1),
+    )
+
+
+def build_sales_cube_from_sums(units_sold: pd.Series, regions: set[str]) -> SalesCube:
+    """
+    Builds the sales cube from units sold already summed per (product_id, region, month),
+    e.g. the 'sales' aggregate of data_modelling.aggregate_chunk. Sums without a month still count
+    for the per-region totals, like rows without a date in build_sales_cube.
+
+    :param units_sold: units sold indexed by product_id, region and month
+    :type units_sold: pd.Series
+
+    :param regions: all regions in the data set
+    :type regions: set[str]
+
+    :return: a sales cube
+    """
+    sums = units_sold.rename("units_sold").reset_index()
+
+    # sums of whole units are stored as integers, like build_sales_cube does for integer units_sold
+    if (sums["units_sold"] % 1 == 0).all():
+        sums["units_sold"] = sums["units_sold"].astype("Int64")
+
+    return build_sales_cube(sums, regions)
+
+
+def get_top_n_products_sold_from_cube(cube: SalesCube, number_of_products: int) -> pd.DataFrame:
+    """
+    Gets n most sold products by units sold across all regions, from the sales cube.
+    Returns the same data structure as get_top_n_products_sold.
+
+    :param cube: a sales cube from build_sales_cube
+    :type cube: SalesCube
+
+    :param number_of_products: number of products to return.
+    :type number_of_products: int
+
+    :return: a dataframe containing n top products by units sold.
+    The dataframe has two columns - product_id and units_sold
+    """
+    units_sold_per_product_df = pd.DataFrame(
+        {
+            "product_id": cube.product_ids,
+            "units_sold": cube.units_sold_per_region.sum(axis=1),
+        }
+    ).sort_values(by="units_sold", ascending=False)
+
+    return units_sold_per_product_df.head(number_of_products)
+
+
+def get_sale_performance_for_products_across_regions_from_cube(
+    cube: SalesCube, products_to_include: pd.DataFrame
+) -> dict:
+    """
+    Gets sale performance for selected products across regions, from the sales cube.
+    Returns the same data structure as get_sale_performance_for_products_across_regions.
+
+    :param cube: a sales cube from build_sales_cube
+    :type cube: SalesCube
+
+    :param products_to_include: products to include from function get_top_n_products.
+    :type products_to_include: pd.DataFrame
+
+    :return: a dictionary containing units sold per region per product, where product_id is dictionary key.
+    The value of the dictionary is a dictionary, where key is region, and value is units sold in that region.
+    """
+    perf_per_region_dict = dict()
+    for product_id in products_to_include["product_id"].unique().tolist():
+        units_sold = cube.units_sold_per_region[cube.product_position(product_id)]
+        perf_per_region_dict[product_id] = dict(zip(cube.regions, units_sold))
+
+    return perf_per_region_dict
+
+
+def get_demand_per_month_from_cube(
+    cube: SalesCube, products_to_include: pd.DataFrame, from_month: int, to_month: int
+) -> dict:
+    """
+    Gets sales for selected products per month in defined range, from the sales cube.
+    Returns the same data structure as get_demand_per_month.
+
+    :param cube: a sales cube from build_sales_cube
+    :type cube: SalesCube
+
+    :param products_to_include: products to include from function get_top_n_products.
+    :type products_to_include: pd.DataFrame
+
+    :param from_month: Month to start from (included)
+    :type from_month: int
+
+    :param to_month: Month to end with (included)
+    :type to_month: int
+
+    :return: a dictionary containing units sold per month per product, where product_id is dictionary key.
+    The value of the dictionary is a dictionary, where key is month, and value is units sold in that month.
+    """
+    months = range(from_month, to_month + 1)
+
+    perf_per_month_dict = dict()
+    for product_id in products_to_include["product_id"].unique().tolist():
+        units_sold = cube.units_sold_per_month[cube.product_position(product_id), from_month - 1:to_month]
+        perf_per_month_dict[product_id] = dict(zip(months, units_sold))
+
+    return perf_per_month_dict
@@ -0,0 +1,305 @@
+"""
+In-process cache for figures and aggregates that don't depend on dropdown values,
+and memoization of callbacks that do.
+
+Entries are keyed by dataset version and parameters, so a figure is built once per
+loaded data set and reused by every callback after that.
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+# every cache that was created, so all of them can be cleared when new data is loaded
+_all_caches = weakref.WeakSet()
+
+
+class DiskCache:
+    """
+    Cache of pickled values in a directory, shared by all processes that use the same directory
+    (e.g. gunicorn workers). Values older than ttl_seconds are ignored, and when there are more than
+    max_entries files, the oldest are removed.
+    Only use it for values built by the app itself: the files are unpickled when read.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 1024, ttl_seconds: float | None = None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: Hashable) -> str:
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest() + ".pkl")
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        """
+        Returns (True, value) if key is cached and not expired, otherwise (False, None)
+        """
+        path = self._path(key)
+        try:
+            if self.ttl_seconds is not None and time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                return False, None
+            with open(path, "rb") as file:
+                return True, pickle.load(file)
+        except Exception:
+            # a missing or truncated file, or a value pickled by other code (e.g. a class that was renamed
+            # since, which raises AttributeError or ImportError) - build the value again
+            return False, None
+
+    def set(self, key: Hashable, value: Any):
+        """
+        Stores value for key, and removes the oldest files if there are more than max_entries
+        """
+        path = self._path(key)
+        # write to a temporary file first, so other processes never read a half-written value
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._prune()
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        for _, path in sorted(entries)[: max(len(entries) - self.max_entries, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self):
+        """
+        Removes all values from the cache
+        """
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+class LRUCache:
+    """
+    Thread-safe cache that keeps at most max_entries values.
+    When the cache is full, the least recently used value is removed.
+    Values older than ttl_seconds are built again. With a backend (DiskCache), values are also
+    stored there and read from there before building them.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 64,
+        ttl_seconds: float | None = None,
+        backend: DiskCache | None = None,
+        name: str | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self.name = name
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        _all_caches.add(self)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._lookup(key)[0]
+
+    def _lookup(self, key: Hashable) -> tuple[bool, Any]:
+        # called with the lock held
+        if key not in self._entries:
+            return False, None
+        value, stored_at = self._entries[key]
+        if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value for key, or builds, stores and returns it.
+
+        :param key: cache key, e.g. from make_key
+        :type key: Hashable
+
+        :param build: function without arguments that builds the value
+        :type build: Callable[[], Any]
+
+        :return: cached or newly built value
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # build outside of the cache lock so a slow figure doesn't block other keys,
+        # but only once per key when several callbacks ask for it at the same time
+        with build_lock:
+            try:
+                with self._lock:
+                    found, value = self._lookup(key)
+                    if found:
+                        self.hits += 1
+                        return value
+
+                found, value = self.backend.get(key) if self.backend is not None else (False, None)
+                if not found:
+                    # counted before building, so a build that raises is a miss too
+                    with self._lock:
+                        self.misses += 1
+                    value = build()
+                    if self.backend is not None:
+                        self.backend.set(key, value)
+
+                with self._lock:
+                    if found:
+                        self.backend_hits += 1
+                    self._entries[key] = (value, time.monotonic())
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            finally:
+                # also when build raises, so failed keys don't keep their lock forever
+                with self._lock:
+                    self._build_locks.pop(key, None)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """
+        Stores a value built elsewhere, e.g. in another process, as if it was built for key.
+
+        :param key: cache key, e.g. from make_key
+        :type key: Hashable
+
+        :param value: the value
+        :type value: Any
+        """
+        if self.backend is not None:
+            self.backend.set(key, value)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """
+        Removes all values from the cache. Values in the backend are kept: their keys include
+        the dataset version, so they are not used for a new version.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+def make_key(name: str, dataset_version: Hashable, **params) -> tuple:
+    """
+    Creates a cache key from a name, dataset version and parameters.
+    Parameters are sorted by name, so the order they are passed in doesn't matter.
+
+    :param name: name of the cached figure or aggregate
+    :type name: str
+
+    :param dataset_version: version of the data set the value is built from
+    :type dataset_version: Hashable
+
+    :return: a cache key
+    """
+    return (name, dataset_version, tuple(sorted(params.items())))
+
+
+def invalidate_all():
+    """
+    Clears every cache. Call it when a new data set is loaded.
+    """
+    for cache in list(_all_caches):
+        cache.invalidate()
+
+
+def memoize(cache: LRUCache, dataset_version: Callable[[], Hashable], unordered: tuple[str, ...] = ()):
+    """
+    Decorator that caches the results of a function of simple values (e.g. a Dash callback),
+    keyed by the function name, dataset_version() and the normalized arguments:
+    lists become tuples, and lists of the parameters in unordered are sorted first,
+    so [2, 1] and [1, 2] share one entry.
+
+    :param cache: the cache to store the results in
+    :type cache: LRUCache
+
+    :param dataset_version: function that returns the version of the data set the function reads
+    :type dataset_version: Callable[[], Hashable]
+
+    :param unordered: names of parameters whose order doesn't matter, e.g. a multi-select dropdown
+    :type unordered: tuple[str, ...]
+
+    :return: the decorator
+    """
+
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def memoized(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            params = {
+                name: _normalize(value, sort=name in unordered) for name, value in arguments.arguments.items()
+            }
+            key = make_key(function.__name__, dataset_version(), **params)
+            return cache.get_or_build(key, lambda: function(*args, **kwargs))
+
+        return memoized
+
+    return decorator
+
+
+def _normalize(value: Any, sort: bool = False) -> Hashable:
+    """
+    Returns a hashable version of a callback argument; lists become (sorted) tuples
+    """
+    if isinstance(value, (list, tuple)):
+        values = [_normalize(item) for item in value]
+        return tuple(sorted(values, key=repr) if sort else values)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _normalize(item)) for key, item in value.items()))
+    return value
+
+
+def to_prometheus() -> str:
+    """
+    Returns hit and miss counters of the named caches in the Prometheus text format
+
+    :return: text for a /metrics response
+    """
+    caches = sorted((cache for cache in list(_all_caches) if cache.name), key=lambda cache: cache.name)
+    lines = []
+    for metric, attribute, description in [
+        ("dashboard_cache_hits_total", "hits", "Values found in memory"),
+        ("dashboard_cache_backend_hits_total", "backend_hits", "Values found in the shared disk cache"),
+        ("dashboard_cache_misses_total", "misses", "Values that were built"),
+    ]:
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+        lines += [f'{metric}{{cache="{cache.name}"}} {getattr(cache, attribute)}' for cache in caches]
+    return "\n".join(lines) + "\n"
@@ -1,3 +1,10 @@
+import hashlib
+import json
+import os
+import threading
+import warnings
+
+import numpy as np
 import pandas as pd
 
 
@@ -16,16 +23,55 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     df = df.drop_duplicates()
     return df
 
+# Column types after changing_columns_name_values:
+# - IDs are compact integers, region is a category
+# - measures use nullable types, so a missing value stays missing (<NA>) and the column stays numeric
+COLUMN_TYPES = {
+    "product_id": "int32",
+    "warehouse_id": "int16",
+    "supplier_id": "int16",
+    "region": "category",
+    "units_sold": "Int32",
+    "inventory_level": "Int32",
+    "supplier_lead_time_days": "Int16",
+    "reorder_point": "Int32",
+    "order_quantity": "Int32",
+    "unit_cost": "float64",
+    "unit_price": "float64",
+    "promotion_flag": "Int8",
+    "demand_forecast": "float64",
+    "month": "Int8",
+    "promo_label": "category",
+}
+
+# Values used for missing data, per column. Columns not listed here keep <NA>.
+MISSING_VALUES = {
+    "region": "Unknown",
+}
+
+# ID columns and the prefix removed from their values. Rows without an ID are removed.
+ID_COLUMNS = {
+    "product_id": "SKU_",
+    "warehouse_id": "WH_",
+    "supplier_id": "SUP_",
+}
+
+# Changes whenever the schema above changes, so cached data sets are rebuilt
+SCHEMA_VERSION = 1
+
+
 def changing_columns_name_values(data: pd.DataFrame) -> pd.DataFrame:
     """
     Transforms dataset into data structure:
     - column names are lowercase and with _ instead of spaces
     - renames column 'sku_id' to 'product_id'
-    - converts columns 'product_id', 'warehouse_id', and 'supplier_id' to number
+    - converts columns 'product_id', 'warehouse_id', and 'supplier_id' to number,
+      rows without a valid ID are removed
     - converts column 'date' to date
     - removes 'stockout_flag' column - it has invalid data
-    - replaces missing values with 'Unknown'
     - adds month column
+    - replaces missing values per column (MISSING_VALUES), other columns keep <NA>
+    - converts columns to the types in COLUMN_TYPES
 
     :param df: a dataframe to transform
     :type df: pd.DataFrame
@@ -37,9 +83,9 @@ def changing_columns_name_values(data: pd.DataFrame) -> pd.DataFrame:
     data.columns = [col.strip().lower().replace(" ", "_") for col in data.columns]
 
     column_data=data.rename(columns={"sku_id":"product_id"})
-    column_data["product_id"]=column_data["product_id"].str.replace("SKU_","",).astype(int)
-    column_data["warehouse_id"]=column_data["warehouse_id"].str.replace("WH_","").astype(int)
-    column_data["supplier_id"]=column_data["supplier_id"].str.replace("SUP_","").astype(int)
+    for column, prefix in ID_COLUMNS.items():
+        column_data[column] = pd.to_numeric(column_data[column].str.replace(prefix, ""), errors="coerce")
+    column_data = column_data.dropna(subset=list(ID_COLUMNS))
 
     # convert Date column to datetime
     column_data["date"] = pd.to_datetime(column_data["date"], errors="coerce")
@@ -48,9 +94,348 @@ def changing_columns_name_values(data: pd.DataFrame) -> pd.DataFrame:
     #Drop rows with invalid data
     column_data = column_data.drop(columns=["stockout_flag"])
 
-    # handle missing values (fill missing values with 'unknown')
-    column_data = column_data.fillna("Unknown")
-    return column_data
+    # handle missing values per column, and use compact types
+    column_data = column_data.fillna(MISSING_VALUES)
+    return apply_column_types(column_data)
+
+
+def apply_column_types(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts columns to the types in COLUMN_TYPES, e.g. after concatenating data sets
+    where categorical columns have different categories.
+
+    :param data: a dataframe to convert
+    :type data: pd.DataFrame
+
+    :return: the dataframe with converted columns
+    """
+    return data.astype({column: dtype for column, dtype in COLUMN_TYPES.items() if column in data.columns})
+
+
+# Labels for promotion_flag values, used in the promo_label column
+PROMOTION_LABELS = {0: "No Promotion", 1: "Promotion"}
+
+
+def add_derived_columns(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the columns derived from the data set that RQ sections use, once, to the data set itself:
+    - difference: units_sold - demand_forecast (RQ1 forecast error)
+    - abs_difference: absolute forecast error (RQ1)
+    - profit: (unit_price - unit_cost) * units_sold (RQ2)
+    - promo_label: 'Promotion' / 'No Promotion' from promotion_flag (RQ1, RQ2)
+    The columns are added in place, so no copy of the data set is made.
+
+    :param data: a dataframe from changing_columns_name_values
+    :type data: pd.DataFrame
+
+    :return: the same dataframe, with derived columns
+    """
+    data["difference"] = data["units_sold"] - data["demand_forecast"]
+    data["abs_difference"] = data["difference"].abs()
+    data["profit"] = (data["unit_price"] - data["unit_cost"]) * data["units_sold"]
+    data["promo_label"] = data["promotion_flag"].map(PROMOTION_LABELS).astype("category")
+    return data
+
+
+# Aggregates built by stream_aggregates: name -> (group by columns, value columns).
+# For each value column the sum and the count of non-missing values are kept,
+# so averages can be computed after all chunks are folded in.
+STREAM_AGGREGATES = {
+    # RQ1: forecast error per warehouse, region and product
+    "forecast_error": (["warehouse_id", "region", "product_id"], ["abs_difference"]),
+    # RQ2: sales and profit with and without promotion, per region, warehouse and month.
+    # The count of promotion_flag is the number of rows (it is never missing within a flag group)
+    "promotions": (
+        ["promotion_flag", "region", "warehouse_id", "month"],
+        ["units_sold", "profit", "promotion_flag"],
+    ),
+    # RQ3: number of orders per supplier and lead time - a histogram of the (whole day) lead times,
+    # from which mean, median, min, max and standard deviation per supplier are computed exactly
+    "supplier_lead_time": (["supplier_id", "supplier_lead_time_days"], ["supplier_lead_time_days"]),
+    # RQ4: inventory, sales, lead time and reorder point per product and warehouse
+    "inventory": (
+        ["product_id", "warehouse_id"],
+        ["units_sold", "inventory_level", "supplier_lead_time_days", "reorder_point"],
+    ),
+    # RQ5: units sold per product, region and month
+    "sales": (["product_id", "region", "month"], ["units_sold"]),
+}
+
+# Sums per day (date_index.build_prefix_sums) for the sections that follow the dashboard date range,
+# in the same format as STREAM_AGGREGATES. The month comes from the days (range_sums(by_month=True))
+DAILY_AGGREGATES = {
+    "forecast_error": (["warehouse_id", "region", "product_id"], ["abs_difference"]),
+    "sales_forecast": (["warehouse_id", "region"], ["units_sold", "demand_forecast"]),
+    "promotions": (["promotion_flag", "region", "warehouse_id"], ["units_sold", "profit", "promotion_flag"]),
+    "supplier_lead_time": (["supplier_id", "supplier_lead_time_days"], ["supplier_lead_time_days"]),
+    "sales": (["product_id", "region"], ["units_sold"]),
+}
+
+
+def iter_clean_chunks(csv_path: str, chunksize: int = 500_000):
+    """
+    Reads the CSV in chunks and yields each chunk cleaned and transformed like the full data set
+    (clean_data and changing_columns_name_values). Duplicate rows are removed across chunks:
+    a 64-bit digest of every row is kept in a sorted array, so memory for deduplication is
+    8 bytes per unique row, next to one chunk of data. Rows are hashed after the column types
+    are applied, so a digest doesn't depend on the types read_csv infers for each chunk.
+
+    :param csv_path: path to the CSV file
+    :type csv_path: str
+
+    :param chunksize: number of rows read at once
+    :type chunksize: int
+
+    :return: generator of cleaned dataframes
+    """
+    seen_digests = np.empty(0, dtype=np.uint64)
+
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        chunk, seen_digests = remove_seen_rows(changing_columns_name_values(clean_data(chunk)), seen_digests)
+        if len(chunk):
+            yield chunk
+
+
+def remove_seen_rows(data: pd.DataFrame, seen_digests: np.ndarray) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Removes duplicate rows, and rows whose 64-bit digest is already in seen_digests.
+
+    :param data: a dataframe with new rows
+    :type data: pd.DataFrame
+
+    :param seen_digests: sorted digests of rows seen before
+    :type seen_digests: np.ndarray
+
+    :return: the new rows that were not seen before, and the sorted digests including them
+    """
+    digests = pd.util.hash_pandas_object(data, index=False).to_numpy()
+
+    # keep the first copy of each row, and only rows not seen before
+    is_new = ~pd.Series(digests).duplicated().to_numpy()
+    positions = np.searchsorted(seen_digests, digests)
+    positions[positions == len(seen_digests)] = 0
+    if len(seen_digests):
+        is_new &= seen_digests[positions] != digests
+
+    # new digests are unique and not in seen_digests yet - insert them in sorted order
+    new_digests = np.sort(digests[is_new])
+    seen_digests = np.insert(seen_digests, np.searchsorted(seen_digests, new_digests), new_digests)
+
+    return data[is_new], seen_digests
+
+
+def stream_aggregates(
+    csv_path: str, chunksize: int = 500_000, aggregates: dict = STREAM_AGGREGATES
+) -> dict[str, pd.DataFrame]:
+    """
+    Builds the aggregates the RQ sections need without loading the whole data set.
+    Chunks from iter_clean_chunks are grouped one by one and added to the running totals,
+    so peak memory depends on chunk size and number of groups, not on file size.
+
+    :param csv_path: path to the CSV file
+    :type csv_path: str
+
+    :param chunksize: number of rows read at once
+    :type chunksize: int
+
+    :param aggregates: aggregates to build, in the same format as STREAM_AGGREGATES
+    :type aggregates: dict
+
+    :return: a dictionary with a dataframe per aggregate name. The dataframe is indexed by the group by
+    columns and has a (column, 'sum') and (column, 'count') column for each value column.
+    Without rows the dataframes are empty.
+    """
+    totals = None
+
+    for chunk in iter_clean_chunks(csv_path, chunksize):
+        chunk = add_derived_columns(chunk)
+        totals = merge_aggregates(totals, aggregate_chunk(chunk, aggregates))
+
+    if totals is None:
+        # no rows - empty aggregates with the same columns and index types
+        empty = changing_columns_name_values(pd.read_csv(csv_path, nrows=0))
+        totals = aggregate_chunk(add_derived_columns(empty), aggregates)
+
+    return totals
+
+
+def aggregate_chunk(data: pd.DataFrame, aggregates: dict = STREAM_AGGREGATES) -> dict[str, pd.DataFrame]:
+    """
+    Builds the aggregates for one chunk of the data set, or for the whole data set.
+    Value columns ending with '_squared' are computed from the column without the suffix.
+    Missing values in group by columns are kept as their own group, so every row is counted.
+
+    :param data: a dataframe with derived columns (add_derived_columns)
+    :type data: pd.DataFrame
+
+    :param aggregates: aggregates to build, in the same format as STREAM_AGGREGATES
+    :type aggregates: dict
+
+    :return: a dictionary with a dataframe per aggregate name, like stream_aggregates
+    """
+    partials = {}
+    for name, (keys, columns) in aggregates.items():
+        # sum as Float64 - agg keeps the compact column types, which would overflow
+        values = pd.DataFrame(
+            {
+                column: data[column.removesuffix("_squared")].astype("Float64") ** 2
+                if column.endswith("_squared") else data[column].astype("Float64")
+                for column in columns
+            }
+        )
+        partials[name] = values.groupby(
+            [data[key] for key in keys], observed=True, dropna=False
+        ).agg(["sum", "count"])
+    return partials
+
+
+def merge_aggregates(totals: dict | None, partials: dict) -> dict[str, pd.DataFrame]:
+    """
+    Adds aggregates of new rows to running totals. Both come from aggregate_chunk.
+
+    :param totals: running totals, or None for the first chunk
+    :type totals: dict | None
+
+    :param partials: aggregates of new rows
+    :type partials: dict
+
+    :return: the updated totals
+    """
+    if totals is None:
+        return partials
+    return {name: totals[name].add(partials[name], fill_value=0) for name in totals}
+
+
+def get_memory_usage_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compares memory used per column by two versions of the data set, e.g. the raw CSV
+    and the result of changing_columns_name_values. Column names of before are standardized
+    the same way as in changing_columns_name_values, so renamed columns are still compared.
+
+    :param before: data set before transformation
+    :type before: pd.DataFrame
+
+    :param after: data set after transformation
+    :type after: pd.DataFrame
+
+    :return: a dataframe with columns column, dtype_before, dtype_after, bytes_before and bytes_after,
+    and a 'total' row at the end
+    """
+    before = before.rename(
+        columns=lambda col: {"sku_id": "product_id"}.get(col.strip().lower().replace(" ", "_"),
+                                                         col.strip().lower().replace(" ", "_"))
+    )
+    before_bytes = before.memory_usage(deep=True, index=False)
+    after_bytes = after.memory_usage(deep=True, index=False)
+
+    report = pd.DataFrame(
+        {
+            "column": after.columns,
+            "dtype_before": [str(before[col].dtype) if col in before.columns else "" for col in after.columns],
+            "dtype_after": [str(dtype) for dtype in after.dtypes],
+            "bytes_before": [int(before_bytes.get(col, 0)) for col in after.columns],
+            "bytes_after": [int(after_bytes[col]) for col in after.columns],
+        }
+    )
+    report.loc[len(report)] = ["total", "", "", int(before_bytes.sum()), int(after_bytes.sum())]
+    return report
+
+
+def load_clean_data(csv_path: str, cache_dir: str = "data/.cache") -> pd.DataFrame:
+    """
+    Loads the data set ready for analysis (read_csv, clean_data and changing_columns_name_values).
+    The cleaned dataframe is cached in cache_dir as an uncompressed Feather file and
+    loaded with memory mapping on the next start. The cache is rebuilt when the CSV changes:
+    - same modification time and size as when the cache was built - the cache is used
+    - otherwise the SHA-256 hash of the CSV is compared, so a touched but unchanged file is not rebuilt
+    If pyarrow is not installed, the CSV is read without caching.
+
+    :param csv_path: path to the CSV file
+    :type csv_path: str
+
+    :param cache_dir: directory for the cached file
+    :type cache_dir: str
+
+    :return: a cleaned up dataframe
+    """
+    try:
+        import pyarrow
+        from pyarrow import feather
+    except ImportError:
+        return changing_columns_name_values(clean_data(pd.read_csv(csv_path))).reset_index(drop=True)
+
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    cache_path = os.path.join(cache_dir, f"{name}.feather")
+    meta_path = os.path.join(cache_dir, f"{name}.json")
+
+    stat = os.stat(csv_path)
+    meta = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "schema": SCHEMA_VERSION}
+
+    cached_meta = None
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path) as meta_file:
+            cached_meta = json.load(meta_file)
+
+    if cached_meta is not None and cached_meta.get("schema") == SCHEMA_VERSION:
+        if cached_meta["mtime_ns"] == meta["mtime_ns"] and cached_meta["size"] == meta["size"]:
+            return feather.read_table(cache_path, memory_map=True).to_pandas()
+
+        meta["sha256"] = _file_sha256(csv_path)
+        if cached_meta.get("sha256") == meta["sha256"]:
+            _write_json(meta_path, meta)
+            return feather.read_table(cache_path, memory_map=True).to_pandas()
+
+    # numbered from 0 like the cached file, so row positions mean the same with and without the cache
+    data = changing_columns_name_values(clean_data(pd.read_csv(csv_path))).reset_index(drop=True)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    meta.setdefault("sha256", _file_sha256(csv_path))
+    try:
+        # write to a temporary file first, so a running process never reads a half-written cache.
+        # The name is unique per process and thread, so processes building the cache at once don't share it
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        feather.write_feather(data, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, cache_path)
+        _write_json(meta_path, meta)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError) as error:
+        warnings.warn(f"Could not cache cleaned data set in {cache_path}: {error}")
+
+    return data
+
+
+def _file_sha256(path: str) -> str:
+    """
+    Returns the SHA-256 hash of a file, read in 1 MB blocks
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path: str, content: dict):
+    """
+    Writes a dictionary to a JSON file, through a temporary file like the Feather cache
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(content, file)
+    os.replace(tmp_path, path)
+
+
+def get_dataset_version(path: str) -> str:
+    """
+    Returns a version string for a data file, based on its modification time and size.
+    The version changes whenever the file is replaced or appended to.
+
+    :param path: path to the data file
+    :type path: str
+
+    :return: a version string
+    """
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
 
 
 def get_unique_supplier_id(data: pd.DataFrame) -> set[int]:
@@ -62,7 +447,7 @@ def get_unique_supplier_id(data: pd.DataFrame) -> set[int]:
 
     :return: a set of unique supplier IDs
     """
-    return set(sorted(data["supplier_id"]))
+    return set(data["supplier_id"].unique().tolist())
 
 def get_unique_warehouse_id(data: pd.DataFrame) -> set[int]:
     """
@@ -73,7 +458,7 @@ def get_unique_warehouse_id(data: pd.DataFrame) -> set[int]:
 
     :return: a set of unique warehouse IDs
     """
-    return set(sorted(data["warehouse_id"]))
+    return set(data["warehouse_id"].unique().tolist())
 
 def get_unique_region(data: pd.DataFrame) -> set[str]:
     """
@@ -84,4 +469,13 @@ def get_unique_region(data: pd.DataFrame) -> set[str]:
 
     :return: a set of unique regions
     """
-    return set(sorted(data["region"]))
\ No newline at end of file
+    return set(data["region"].unique().tolist())
+
+
+if __name__ == "__main__":
+    # python -m analysis.data_modelling <csv file> - prints memory used per column before and after typing
+    import sys
+
+    raw_data = clean_data(pd.read_csv(sys.argv[1]))
+    typed_data = changing_columns_name_values(raw_data.copy())
+    print(get_memory_usage_report(raw_data, typed_data).to_string(index=False))
@@ -0,0 +1,333 @@
+"""
+The data set the dashboard serves, and incremental refresh of it.
+
+New data can arrive in two ways:
+- rows appended to the CSV file
+- new CSV files (with the same columns) in the partition directory
+Only the new rows are cleaned and added to the aggregates; the result is a new Dataset
+that replaces the current one in one assignment, so requests in flight keep the version they started with.
+Rows are kept sorted by date, so the rows of a date range are one slice (see analysis.date_index).
+"""
+
+import glob
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+import analysis.cache as cache
+import analysis.data_modelling as dm
+import analysis.date_index as di
+
+logger = logging.getLogger("dashboard.dataset")
+
+# number of bytes before the read position that are compared to detect a rewritten CSV
+_TAIL_BYTES = 4096
+
+# changes whenever the cached state changes meaning (2: kept rows in date order)
+_STATE_FORMAT = 2
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """
+    One loaded version of the data set:
+    - data: cleaned rows with derived columns (dm.add_derived_columns), sorted by date
+    - date_index: where each day starts in data
+    - version: changes whenever rows are added, used in cache keys
+    - aggregates: running totals from dm.aggregate_chunk, updated with new rows only
+    - row_digests: sorted digests of all rows, to skip rows that are loaded again
+    - csv_path, csv_offset, csv_tail_digest: CSV file and how far it has been read
+    - partition_dir, partitions: directory with extra CSV files and the files already loaded
+    """
+
+    data: pd.DataFrame
+    date_index: di.DateIndex
+    version: str
+    aggregates: dict
+    row_digests: np.ndarray
+    csv_path: str
+    csv_offset: int
+    csv_tail_digest: str
+    partition_dir: str | None
+    partitions: frozenset
+
+
+def load_dataset(csv_path: str, partition_dir: str | None = None, cache_dir: str = "data/.cache") -> Dataset:
+    """
+    Loads the CSV (through the cleaned data cache) and all partition files.
+    Which rows are kept after removing duplicates, the row digests and the aggregates are
+    cached in cache_dir too, for the same data set version, so a restart doesn't compute them again.
+
+    :param csv_path: path to the CSV file
+    :type csv_path: str
+
+    :param partition_dir: directory with extra CSV files, or None
+    :type partition_dir: str | None
+
+    :param cache_dir: directory for the cached files
+    :type cache_dir: str
+
+    :return: the loaded data set
+    """
+    data = dm.load_clean_data(csv_path, cache_dir)
+
+    partitions = _list_partitions(partition_dir)
+    if partitions:
+        data = dm.apply_column_types(
+            pd.concat([data] + [_read_clean_csv(path) for path in sorted(partitions)], ignore_index=True)
+        )
+
+    version = _make_version(csv_path, partitions)
+    state_path = os.path.join(cache_dir, os.path.splitext(os.path.basename(csv_path))[0] + ".state.pkl")
+    state = _read_state(state_path, version)
+    if state is None:
+        kept_data, row_digests = dm.remove_seen_rows(data, np.empty(0, dtype=np.uint64))
+        kept_data = kept_data.iloc[di.sort_by_date(kept_data["date"])]
+        data = dm.add_derived_columns(kept_data.reset_index(drop=True))
+        state = {
+            "kept_rows": kept_data.index.to_numpy(),
+            "row_digests": row_digests,
+            "aggregates": dm.aggregate_chunk(data),
+        }
+        _write_state(state_path, version, state)
+    else:
+        # kept rows are stored in date order, so taking them also sorts the data
+        kept_rows = state["kept_rows"]
+        if len(kept_rows) < len(data) or (np.diff(kept_rows) < 0).any():
+            data = data.take(kept_rows).reset_index(drop=True)
+        data = dm.add_derived_columns(data)
+
+    csv_offset = os.path.getsize(csv_path)
+    return Dataset(
+        data=data,
+        date_index=di.build_date_index(data["date"]),
+        version=version,
+        aggregates=state["aggregates"],
+        row_digests=state["row_digests"],
+        csv_path=csv_path,
+        csv_offset=csv_offset,
+        csv_tail_digest=_tail_digest(csv_path, csv_offset),
+        partition_dir=partition_dir,
+        partitions=frozenset(partitions),
+    )
+
+
+def refresh_dataset(dataset: Dataset) -> Dataset | None:
+    """
+    Loads rows added since the data set was loaded.
+    If the CSV was rewritten instead of appended to, the whole data set is loaded again.
+
+    :param dataset: the current data set
+    :type dataset: Dataset
+
+    :return: a new data set including the new rows, or None when there is nothing new
+    """
+    csv_size = os.path.getsize(dataset.csv_path)
+    if csv_size < dataset.csv_offset or _tail_digest(dataset.csv_path, dataset.csv_offset) != dataset.csv_tail_digest:
+        return load_dataset(dataset.csv_path, dataset.partition_dir)
+
+    new_partitions = _list_partitions(dataset.partition_dir) - dataset.partitions
+    appended, csv_offset = _read_appended_rows(dataset.csv_path, dataset.csv_offset)
+
+    new_rows = [_read_clean_csv(path) for path in sorted(new_partitions)]
+    if appended is not None:
+        new_rows.append(dm.changing_columns_name_values(dm.clean_data(appended)))
+    if not new_rows:
+        return None
+
+    new_data = dm.apply_column_types(pd.concat(new_rows, ignore_index=True))
+    new_data, row_digests = dm.remove_seen_rows(new_data, dataset.row_digests)
+    new_data = dm.add_derived_columns(new_data)
+
+    # new rows usually have the latest dates - the stable sort is fast on data that is almost sorted
+    data = pd.concat([dataset.data, new_data], ignore_index=True)
+    data = dm.apply_column_types(data.take(di.sort_by_date(data["date"])).reset_index(drop=True))
+
+    partitions = dataset.partitions | new_partitions
+    return Dataset(
+        data=data,
+        date_index=di.build_date_index(data["date"]),
+        version=_make_version(dataset.csv_path, partitions),
+        aggregates=dm.merge_aggregates(dataset.aggregates, dm.aggregate_chunk(new_data)),
+        row_digests=row_digests,
+        csv_path=dataset.csv_path,
+        csv_offset=csv_offset,
+        csv_tail_digest=_tail_digest(dataset.csv_path, csv_offset),
+        partition_dir=dataset.partition_dir,
+        partitions=frozenset(partitions),
+    )
+
+
+def has_new_data(dataset: Dataset) -> bool:
+    """
+    Checks, without loading anything, if refresh_dataset would find new data: complete lines appended
+    to the CSV, a rewritten CSV or new files in the partition directory.
+
+    :param dataset: the current data set
+    :type dataset: Dataset
+
+    :return: True if there is new data
+    """
+    if os.path.getsize(dataset.csv_path) < dataset.csv_offset:
+        return True
+    if _tail_digest(dataset.csv_path, dataset.csv_offset) != dataset.csv_tail_digest:
+        return True
+    if _list_partitions(dataset.partition_dir) - dataset.partitions:
+        return True
+
+    with open(dataset.csv_path, "rb") as file:
+        file.seek(dataset.csv_offset)
+        appended = file.read()
+    return bool(appended[: appended.rfind(b"\n") + 1].strip())
+
+
+class DatasetStore:
+    """
+    Holds the data set that is served. Callbacks read current once and use that version
+    for the whole request; refresh swaps in a new version with a single assignment.
+    """
+
+    def __init__(self, dataset: Dataset):
+        self.current = dataset
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        """
+        Loads new rows, if there are any, and makes them the current data set.
+        Caches keyed by the old version are cleared.
+
+        :return: True if a new version was loaded
+        """
+        with self._refresh_lock:
+            new_dataset = refresh_dataset(self.current)
+            if new_dataset is None:
+                return False
+            self.current = new_dataset
+
+        cache.invalidate_all()
+        return True
+
+    def watch(self, interval_seconds: float, on_new_data: Callable[[], None] | None = None) -> threading.Thread:
+        """
+        Starts a background thread that calls refresh every interval_seconds.
+        With on_new_data, the thread only checks for new data (has_new_data) and calls on_new_data
+        when there is some, e.g. to have the gunicorn master reload the data for all workers.
+
+        :param interval_seconds: time between checks for new data
+        :type interval_seconds: float
+
+        :param on_new_data: called instead of refresh when there is new data
+        :type on_new_data: Callable[[], None] | None
+
+        :return: the started thread
+        """
+
+        def check_for_new_data():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    if on_new_data is None:
+                        self.refresh()
+                    elif has_new_data(self.current):
+                        on_new_data()
+                except Exception:
+                    # keep serving the current version, and try again on the next check
+                    logger.exception("Refreshing the data set failed")
+
+        thread = threading.Thread(target=check_for_new_data, name="dataset-watcher", daemon=True)
+        thread.start()
+        return thread
+
+
+def _read_state(state_path: str, version: str) -> dict | None:
+    """
+    Returns the cached kept rows, row digests and aggregates of a data set version, or None
+    """
+    if not os.path.exists(state_path):
+        return None
+    state = pd.read_pickle(state_path)
+    if state.get("key") != _state_key(version):
+        return None
+    return state
+
+
+def _write_state(state_path: str, version: str, state: dict):
+    """
+    Caches the kept rows, row digests and aggregates of a data set version
+    """
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    # write to a temporary file first, so a running process never reads a half-written cache.
+    # The name is unique per process and thread, so processes writing the state at once don't share it
+    tmp_path = f"{state_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pd.to_pickle({**state, "key": _state_key(version)}, tmp_path)
+    os.replace(tmp_path, state_path)
+
+
+def _state_key(version: str) -> str:
+    """
+    Key of the cached state: the data set version, schema version, state format and the aggregates that are built
+    """
+    aggregates_digest = hashlib.sha256(repr(dm.STREAM_AGGREGATES).encode()).hexdigest()[:12]
+    return f"{version}-{dm.SCHEMA_VERSION}-{_STATE_FORMAT}-{aggregates_digest}"
+
+
+def _read_clean_csv(path: str) -> pd.DataFrame:
+    """
+    Reads a CSV file and cleans it like the main data set
+    """
+    return dm.changing_columns_name_values(dm.clean_data(pd.read_csv(path)))
+
+
+def _read_appended_rows(csv_path: str, offset: int) -> tuple[pd.DataFrame | None, int]:
+    """
+    Reads complete lines added to the CSV after offset.
+    Returns the rows (None if there are none) and the new offset.
+    """
+    with open(csv_path, "rb") as file:
+        header = file.readline()
+        file.seek(offset)
+        appended = file.read()
+
+    # a line that is still being written is read on the next refresh
+    complete = appended[: appended.rfind(b"\n") + 1]
+    if not complete.strip():
+        return None, offset
+
+    return pd.read_csv(io.BytesIO(header + complete)), offset + len(complete)
+
+
+def _tail_digest(csv_path: str, offset: int) -> str:
+    """
+    Returns a digest of the bytes just before offset, to check that the part already read is unchanged
+    """
+    with open(csv_path, "rb") as file:
+        file.seek(max(offset - _TAIL_BYTES, 0))
+        return hashlib.sha256(file.read(min(offset, _TAIL_BYTES))).hexdigest()
+
+
+def _list_partitions(partition_dir: str | None) -> set:
+    """
+    Returns paths of CSV files in the partition directory
+    """
+    if partition_dir is None:
+        return set()
+    return set(glob.glob(os.path.join(partition_dir, "*.csv")))
+
+
+def _make_version(csv_path: str, partitions) -> str:
+    """
+    Version of the data set from the CSV version and the names and versions of the partition files loaded,
+    so a partition file that is replaced under the same name gives a new version
+    """
+    partitions_digest = hashlib.sha256(
+        "\n".join(f"{path} {dm.get_dataset_version(path)}" for path in sorted(partitions)).encode()
+    ).hexdigest()[:12]
+    return f"{dm.get_dataset_version(csv_path)}-{partitions_digest}"
@@ -0,0 +1,257 @@
+"""
+Date index of the data set, and sums per day stored as prefix sums.
+
+The rows of a Dataset are sorted by date, with rows without a date last. The rows of a date range are then
+one contiguous block: two searchsorted calls on the distinct days give its first and last row, instead of
+a boolean mask over the whole data set.
+Sections that need sums for any date range keep them per group and day, cumulated over the days, so the
+sums of a range are the difference of two cumulated totals per group. Only the days on which a group has
+rows are stored, and the totals before a day are found with searchsorted.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+def sort_by_date(dates: pd.Series) -> np.ndarray:
+    """
+    Returns the positions that sort rows by date. Rows with the same date keep their order,
+    rows without a date come last.
+
+    :param dates: the date column
+    :type dates: pd.Series
+
+    :return: an array of row positions
+    """
+    values = dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    values = np.where(dates.isna().to_numpy(), np.iinfo(np.int64).max, values)
+    return np.argsort(values, kind="stable")
+
+
+def slice_sorted(values: np.ndarray, start_date=None, end_date=None) -> slice:
+    """
+    Returns the positions of values between start_date and end_date (both included) as a slice.
+
+    :param values: sorted dates (datetime64)
+    :type values: np.ndarray
+
+    :param start_date: first date, e.g. '2024-01-31', or None for no lower bound
+    :param end_date: last date, or None for no upper bound
+
+    :return: a slice of values
+    """
+    start = 0 if start_date is None else int(np.searchsorted(values, _to_day(start_date), side="left"))
+    stop = len(values) if end_date is None else int(np.searchsorted(values, _to_day(end_date), side="right"))
+    return slice(start, max(stop, start))
+
+
+def _to_day(value) -> np.datetime64:
+    """
+    Converts a date from a date picker ('2024-01-31' or '2024-01-31T00:00:00') to a day
+    """
+    return pd.Timestamp(value).to_datetime64().astype("datetime64[D]")
+
+
+@dataclass(frozen=True)
+class DateIndex:
+    """
+    Where each day starts in the date-sorted rows of a data set:
+    - days: distinct dates, sorted (datetime64[D])
+    - offsets: first row of each day, followed by the number of rows with a date
+    - rows: number of rows, including the rows without a date after the dated ones
+    """
+
+    days: np.ndarray
+    offsets: np.ndarray
+    rows: int
+
+    def day_range(self, start_date=None, end_date=None) -> slice:
+        """
+        Returns the positions of the days between start_date and end_date (both included)
+        """
+        return slice_sorted(self.days, start_date, end_date)
+
+    def covers_all(self, start_date=None, end_date=None) -> bool:
+        """
+        Returns True if the range includes every day of the data set
+        """
+        days = self.day_range(start_date, end_date)
+        return days.start == 0 and days.stop == len(self.days)
+
+    def is_empty(self, start_date=None, end_date=None) -> bool:
+        """
+        Returns True if no rows are between start_date and end_date, e.g. for a range after the last day,
+        a range that ends before it starts or a gap in the data
+        """
+        rows = self.row_slice(start_date, end_date)
+        return rows.start == rows.stop
+
+    def row_slice(self, start_date=None, end_date=None) -> slice:
+        """
+        Returns the rows between start_date and end_date (both included) as a slice.
+        When the range includes every day, rows without a date are included too,
+        like the month filters of RQ2 and RQ5 include them for the whole year.
+        """
+        if self.covers_all(start_date, end_date):
+            return slice(0, self.rows)
+        days = self.day_range(start_date, end_date)
+        return slice(int(self.offsets[days.start]), int(self.offsets[days.stop]))
+
+
+def build_date_index(dates: pd.Series) -> DateIndex:
+    """
+    Builds the date index of date-sorted rows (sort_by_date).
+
+    :param dates: the date column of the sorted rows
+    :type dates: pd.Series
+
+    :return: the date index
+    """
+    values = dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+    dated = values[~np.isnat(values)]
+
+    # a new day starts on every row where the date differs from the row before
+    is_day_start = np.ones(len(dated), dtype=bool)
+    is_day_start[1:] = dated[1:] != dated[:-1]
+    starts = np.flatnonzero(is_day_start)
+
+    return DateIndex(days=dated[starts], offsets=np.append(starts, len(dated)), rows=len(values))
+
+
+@dataclass(frozen=True)
+class PrefixSums:
+    """
+    Sums and counts of value columns per group and day, cumulated over the days of each group.
+    Only days on which a group has rows are stored, so the size grows with the number of rows,
+    not with days * groups:
+    - index: date index of the rows the sums are built from
+    - groups: the groups, indexed by the group by columns
+    - columns: (column, 'sum') and (column, 'count') for each value column, like dm.aggregate_chunk
+    - keys: group position * number of days + day position of every stored (group, day), sorted
+    - group_offsets: first stored day of each group, followed by the number of stored days
+    - cumulative: array with shape (stored days, columns), the totals of a group up to and including the day
+    """
+
+    index: DateIndex
+    groups: pd.Index
+    columns: pd.MultiIndex
+    keys: np.ndarray
+    group_offsets: np.ndarray
+    cumulative: np.ndarray
+
+    def totals_before(self, day_positions: np.ndarray) -> np.ndarray:
+        """
+        Returns the totals of every group over the days before each day position (0 to number of days).
+
+        :param day_positions: positions in index.days
+        :type day_positions: np.ndarray
+
+        :return: array with shape (day positions, groups, columns)
+        """
+        n_groups = len(self.groups)
+        day_positions = np.asarray(day_positions, dtype=np.int64)
+        if not len(self.keys):
+            return np.zeros((len(day_positions), n_groups, len(self.columns)))
+        # last stored day of each group before the day: one searchsorted per group and day position
+        targets = day_positions[:, None] + np.arange(n_groups, dtype=np.int64) * len(self.index.days)
+        last = np.searchsorted(self.keys, targets, side="left") - 1
+        stored = last >= self.group_offsets[:-1]
+        return np.where(stored[..., None], self.cumulative[np.maximum(last, 0)], 0.0)
+
+    def dense_cumulative(self) -> np.ndarray:
+        """
+        Returns the totals of the days before every day as an array with shape (days + 1, groups, columns).
+        Its size is days * groups, only use it for group by columns with few groups.
+        """
+        return self.totals_before(np.arange(len(self.index.days) + 1))
+
+    def range_sums(self, start_date=None, end_date=None, by_month: bool = False) -> pd.DataFrame:
+        """
+        Returns the sums and counts of the days between start_date and end_date (both included),
+        in the same format as dm.aggregate_chunk. Groups without values in the range are left out.
+
+        :param start_date: first date, or None for the first day
+        :param end_date: last date, or None for the last day
+
+        :param by_month: also group by month (1-12), e.g. for the month filters of RQ2 and RQ5
+        :type by_month: bool
+
+        :return: a dataframe indexed by the group by columns (and month)
+        """
+        days = self.index.day_range(start_date, end_date)
+
+        if not by_month:
+            before = self.totals_before(np.array([days.start, days.stop]))
+            sums = pd.DataFrame(before[1] - before[0], index=self.groups, columns=self.columns)
+        else:
+            # every calendar month in the range is one block of days, added to the sums of its month number
+            months = self.index.days[days].astype("datetime64[M]")
+            block_starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]]) if len(months) else np.empty(0, int)
+            before = self.totals_before(np.append(block_starts + days.start, days.stop))
+            month_sums = np.zeros((12, len(self.groups), len(self.columns)))
+            np.add.at(month_sums, months[block_starts].astype(np.int64) % 12, before[1:] - before[:-1])
+
+            n_groups = len(self.groups)
+            group_index = pd.MultiIndex.from_arrays(
+                [self.groups.get_level_values(level).repeat(12) for level in range(self.groups.nlevels)]
+                + [np.tile(np.arange(1, 13), n_groups)],
+                names=list(self.groups.names) + ["month"],
+            )
+            sums = pd.DataFrame(
+                month_sums.transpose(1, 0, 2).reshape(n_groups * 12, -1), index=group_index, columns=self.columns
+            )
+
+        counts = sums.loc[:, sums.columns.get_level_values(1) == "count"]
+        return sums[(counts > 0).any(axis=1)]
+
+
+def build_prefix_sums(data: pd.DataFrame, index: DateIndex, keys: list[str], columns: list[str]) -> PrefixSums:
+    """
+    Builds sums and counts of columns per group of keys and day, cumulated over the days of each group.
+    Rows without a date are not included.
+
+    :param data: date-sorted rows (sort_by_date)
+    :type data: pd.DataFrame
+
+    :param index: date index of data
+    :type index: DateIndex
+
+    :param keys: group by columns
+    :type keys: list[str]
+
+    :param columns: value columns
+    :type columns: list[str]
+
+    :return: the prefix sums
+    """
+    dated = data.iloc[: int(index.offsets[-1])]
+    n_days = len(index.days)
+    day_positions = np.repeat(np.arange(n_days, dtype=np.int64), np.diff(index.offsets))
+
+    # missing values in group by columns are their own group, like in dm.aggregate_chunk
+    grouped = dated.groupby([dated[key] for key in keys], observed=True, dropna=False, sort=True)
+    group_positions = grouped.ngroup().to_numpy().astype(np.int64)
+    groups = grouped.size().index
+
+    # one entry per group and day with rows, sorted by group and day
+    entry_keys, entry_positions = np.unique(group_positions * n_days + day_positions, return_inverse=True)
+    sums = []
+    for column in columns:
+        values = dated[column].astype("Float64")
+        for weights in (values.to_numpy(dtype=float, na_value=0), values.notna().to_numpy(dtype=float)):
+            sums.append(np.bincount(entry_positions, weights=weights, minlength=len(entry_keys)))
+
+    # cumulated within each group
+    entry_groups = entry_keys // max(n_days, 1)
+    cumulative = pd.DataFrame(np.stack(sums, axis=-1)).groupby(entry_groups).cumsum().to_numpy()
+
+    return PrefixSums(
+        index=index,
+        groups=groups,
+        columns=pd.MultiIndex.from_product([columns, ["sum", "count"]]),
+        keys=entry_keys,
+        group_offsets=np.searchsorted(entry_keys, np.arange(len(groups) + 1, dtype=np.int64) * n_days),
+        cumulative=cumulative,
+    )
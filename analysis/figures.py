@@ -0,0 +1,311 @@
+"""
+Figure helpers shared by the RQ sections.
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+
+def compute_box_stats(
+    df: pd.DataFrame, group_column: str, value_column: str, max_outliers: int = 100
+) -> pd.DataFrame:
+    """
+    Computes box plot statistics per group on the server, the same way plotly does in the browser:
+    - quartiles use linear interpolation (plotly's default quartilemethod)
+    - whiskers end at the most extreme value within 1.5 * IQR of the box
+    - values outside the whiskers are outliers, at most max_outliers per group are kept.
+      The kept outliers are spread evenly over the sorted outliers, so the most extreme ones are always kept.
+
+    :param df: a dataframe with one row per value
+    :type df: pd.DataFrame
+
+    :param group_column: column with the group of each value, one box is drawn per group
+    :type group_column: str
+
+    :param value_column: column with the values
+    :type value_column: str
+
+    :param max_outliers: maximum number of outliers kept per group
+    :type max_outliers: int
+
+    :return: a dataframe with one row per group and columns
+    group_column, q1, median, q3, lowerfence, upperfence, count and outliers (a list)
+    """
+    data = df[[group_column, value_column]].dropna()
+    values = data[value_column].astype(float)
+    if values.empty:
+        # quantile of no groups has no columns - no boxes, so plot_box_stats draws an empty figure
+        return pd.DataFrame(columns=[group_column, "q1", "median", "q3", "lowerfence", "upperfence", "count", "outliers"])
+    grouped = values.groupby(data[group_column], observed=True)
+
+    stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "median", "q3"]
+    iqr = stats["q3"] - stats["q1"]
+
+    # whiskers - most extreme values within 1.5 * IQR of the box
+    low_limit = data[group_column].map(stats["q1"] - 1.5 * iqr).astype(float)
+    high_limit = data[group_column].map(stats["q3"] + 1.5 * iqr).astype(float)
+    in_fence = (values >= low_limit) & (values <= high_limit)
+    fenced = values[in_fence].groupby(data.loc[in_fence, group_column], observed=True)
+    stats["lowerfence"] = fenced.min()
+    stats["upperfence"] = fenced.max()
+    stats["count"] = grouped.size()
+
+    # outliers - evenly spaced sample of the sorted outliers of each group
+    outliers = values[~in_fence].groupby(data.loc[~in_fence, group_column], observed=True)
+    stats["outliers"] = pd.Series(
+        {group: _sample_sorted(group_values.to_numpy(), max_outliers) for group, group_values in outliers}
+    ).reindex(stats.index)
+    stats["outliers"] = stats["outliers"].apply(lambda sample: sample if isinstance(sample, list) else [])
+
+    return stats.rename_axis(group_column).reset_index()
+
+
+def _sample_sorted(values: np.ndarray, max_values: int) -> list:
+    """
+    Returns at most max_values of the sorted values, evenly spaced and including the smallest and largest
+    """
+    values = np.sort(values)
+    if len(values) > max_values:
+        values = values[np.linspace(0, len(values) - 1, max_values).round().astype(int)]
+    return values.tolist()
+
+
+def plot_box_stats(
+    stats: pd.DataFrame,
+    group_column: str,
+    title: str,
+    labels: dict | None = None,
+    color_by_group: bool = False,
+    category_order: list | None = None,
+) -> go.Figure:
+    """
+    Draws box plots from statistics computed by compute_box_stats.
+    The figure size depends on the number of groups and outliers, not on the number of rows.
+
+    :param stats: statistics from compute_box_stats
+    :type stats: pd.DataFrame
+
+    :param group_column: column with the group of each box
+    :type group_column: str
+
+    :param title: figure title
+    :type title: str
+
+    :param labels: axis titles, as {"x": ..., "y": ...}
+    :type labels: dict
+
+    :param color_by_group: draw each box in its own color, like px.box(color=...)
+    :type color_by_group: bool
+
+    :param category_order: order of the groups on the x axis
+    :type category_order: list
+
+    :return: a figure
+    """
+    labels = labels or {}
+    colors = px.colors.qualitative.Plotly
+
+    fig = go.Figure()
+    for position, row in enumerate(stats.itertuples(index=False)):
+        group = str(getattr(row, group_column))
+        color = colors[position % len(colors)] if color_by_group else colors[0]
+
+        fig.add_trace(
+            go.Box(
+                x=[group],
+                q1=[row.q1],
+                median=[row.median],
+                q3=[row.q3],
+                lowerfence=[row.lowerfence],
+                upperfence=[row.upperfence],
+                name=group,
+                marker_color=color,
+                boxpoints=False,
+                hovertext=f"count: {row.count}",
+            )
+        )
+        if row.outliers:
+            fig.add_trace(
+                go.Scatter(
+                    x=[group] * len(row.outliers),
+                    y=row.outliers,
+                    mode="markers",
+                    name=group,
+                    marker=dict(color=color, size=4),
+                    showlegend=False,
+                )
+            )
+
+    fig.update_layout(
+        title=title,
+        xaxis_title=labels.get("x", group_column),
+        yaxis_title=labels.get("y"),
+        showlegend=False,
+    )
+    if category_order is not None:
+        fig.update_xaxes(categoryorder="array", categoryarray=[str(group) for group in category_order])
+    return fig
+
+
+def plot_no_data(title: str, message: str = "No data in the selected date range") -> go.Figure:
+    """
+    Draws an empty figure with a message in the middle, for a selection without rows.
+
+    :param title: figure title
+    :type title: str
+
+    :param message: the message
+    :type message: str
+
+    :return: a figure
+    """
+    fig = go.Figure()
+    fig.add_annotation(text=message, xref="paper", yref="paper", x=0.5, y=0.5, showarrow=False, font=dict(size=16))
+    fig.update_layout(title=title, template="plotly_white", xaxis_visible=False, yaxis_visible=False)
+    return fig
+
+
+def linear_fit(x, y) -> dict:
+    """
+    Fits y = slope * x + intercept by ordinary least squares, in closed form.
+    Gives the same line as plotly's trendline="ols", without importing statsmodels.
+
+    :param x: x values
+    :type x: array-like
+
+    :param y: y values
+    :type y: array-like
+
+    :return: a dictionary with slope, intercept, r_squared, slope_stderr (standard error of the slope,
+    NaN with fewer than 3 points) and n (number of points used, points with missing or infinite values
+    are skipped). Without 2 distinct x values there is no line, and all values but n are NaN
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    n = len(x)
+    if n < 2 or x.min() == x.max():
+        return {"slope": np.nan, "intercept": np.nan, "r_squared": np.nan, "slope_stderr": np.nan, "n": n}
+
+    # deviations from the means, so large values don't lose precision
+    dx = x - x.mean()
+    dy = y - y.mean()
+    sxx = (dx**2).sum()
+    syy = (dy**2).sum()
+    slope = (dx * dy).sum() / sxx
+    intercept = y.mean() - slope * x.mean()
+
+    residual_sum_of_squares = ((dy - slope * dx) ** 2).sum()
+    r_squared = 1 - residual_sum_of_squares / syy if syy > 0 else np.nan
+    slope_stderr = np.sqrt(residual_sum_of_squares / (n - 2) / sxx) if n > 2 else np.nan
+
+    return {
+        "slope": slope,
+        "intercept": intercept,
+        "r_squared": r_squared,
+        "slope_stderr": slope_stderr,
+        "n": n,
+    }
+
+
+def add_trendline(fig: go.Figure, x, y, x_label: str, y_label: str) -> dict:
+    """
+    Adds an OLS trendline (linear_fit) to a scatter figure, as a line through the range of x.
+    The hover text shows the equation, r² and the standard error of the slope.
+    Without 2 distinct x values (e.g. no points or one point) no line is added.
+
+    :param fig: the scatter figure
+    :type fig: go.Figure
+
+    :param x: x values of the points
+    :type x: array-like
+
+    :param y: y values of the points
+    :type y: array-like
+
+    :param x_label: name of x in the equation
+    :type x_label: str
+
+    :param y_label: name of y in the equation
+    :type y_label: str
+
+    :return: the fit from linear_fit
+    """
+    fit = linear_fit(x, y)
+    if np.isnan(fit["slope"]):
+        return fit
+    x_values = np.asarray(x, dtype=float)
+    x_values = x_values[np.isfinite(x_values) & np.isfinite(np.asarray(y, dtype=float))]
+    x_line = np.array([x_values.min(), x_values.max()])
+
+    hover = (
+        "<b>OLS trendline</b><br>"
+        f"{y_label} = {fit['slope']:.4g} * {x_label} + {fit['intercept']:.4g}<br>"
+        f"R<sup>2</sup>={fit['r_squared']:.4f}<br>"
+        f"slope standard error={fit['slope_stderr']:.4g}"
+        "<extra></extra>"
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=x_line,
+            y=fit["slope"] * x_line + fit["intercept"],
+            mode="lines",
+            name="OLS trendline",
+            hovertemplate=hover,
+            showlegend=False,
+        )
+    )
+    return fit
+
+
+def lttb(x, y, max_points: int) -> np.ndarray:
+    """
+    Picks at most max_points points of a line that keep its visual shape, with the
+    Largest-Triangle-Three-Buckets algorithm: the first and last point are kept, the points in between
+    are split into buckets and from each bucket the point that forms the largest triangle with the point
+    picked before it and the average of the next bucket is kept.
+
+    :param x: x values, sorted (numbers or dates)
+    :type x: array-like
+
+    :param y: y values
+    :type y: array-like
+
+    :param max_points: number of points to keep, at least 3
+    :type max_points: int
+
+    :return: positions of the kept points, sorted
+    """
+    x = np.asarray(x)
+    x = x.astype("datetime64[ns]").view(np.int64).astype(float) if np.issubdtype(x.dtype, np.datetime64) else x.astype(float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    # max_points - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    for bucket in range(max_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[stop:edges[bucket + 2]].mean()
+            next_y = y[stop:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+
+        previous = kept[bucket]
+        # twice the triangle areas - only the largest matters
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        kept[bucket + 1] = start + int(np.argmax(areas))
+
+    return kept
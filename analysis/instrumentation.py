@@ -0,0 +1,275 @@
+"""
+Latency, memory and response size of Dash callbacks.
+
+Callbacks decorated with instrument record for every call:
+- wall time, and the time spent in the "data" and "figure" phases, marked with phase() in the callback
+- peak traced memory, when tracemalloc is running (DASHBOARD_TRACE_MEMORY=1 in main.py).
+  The peak is process wide, so callbacks running at the same time in other threads are included
+- the input values, logged and kept for the slowest recent calls
+- response size, recorded by the after_request hook in serving.log_callback_payload_sizes
+
+Quantiles are computed over the last WINDOW calls of each callback, sums and counts over all calls.
+Each process keeps its own numbers; with several gunicorn workers, every worker reports the calls it served.
+"""
+
+import contextvars
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+import flask
+import numpy as np
+from dash.exceptions import PreventUpdate
+
+logger = logging.getLogger("dashboard.callbacks")
+
+# number of recent calls per callback used for quantiles
+WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+# measure -> description, exported as dashboard_callback_<measure>
+MEASURES = {
+    "seconds": "Wall time of the callback",
+    "data_seconds": "Time spent preparing data in the callback",
+    "figure_seconds": "Time spent building figures in the callback",
+    "peak_memory_bytes": "Peak traced memory allocated during the callback",
+    "payload_bytes": "Size of the callback response before compression",
+}
+
+# phase times of the callback running in the current thread
+_current_call = contextvars.ContextVar("current_call", default=None)
+
+
+class CallbackMetrics:
+    """
+    Thread-safe store of callback measurements
+    """
+
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, name: str) -> dict:
+        # called with the lock held
+        if name not in self._callbacks:
+            self._callbacks[name] = {
+                "calls": 0,
+                "errors": 0,
+                "sums": dict.fromkeys(MEASURES, 0.0),
+                "counts": dict.fromkeys(MEASURES, 0),
+                "recent": {measure: deque(maxlen=self.window) for measure in MEASURES},
+                "recent_inputs": deque(maxlen=self.window),
+            }
+        return self._callbacks[name]
+
+    def observe(self, name: str, measure: str, value: float):
+        """
+        Records one value of a measure for a callback.
+
+        :param name: callback name
+        :type name: str
+
+        :param measure: one of MEASURES
+        :type measure: str
+
+        :param value: the measured value
+        :type value: float
+        """
+        with self._lock:
+            stats = self._stats(name)
+            stats["sums"][measure] += value
+            stats["counts"][measure] += 1
+            stats["recent"][measure].append(value)
+
+    def record_call(self, name: str, measurements: dict, inputs: tuple, failed: bool):
+        """
+        Records one callback call.
+
+        :param name: callback name
+        :type name: str
+
+        :param measurements: values per measure, e.g. {"seconds": 0.2, "figure_seconds": 0.1}
+        :type measurements: dict
+
+        :param inputs: the callback arguments
+        :type inputs: tuple
+
+        :param failed: True if the callback raised an error
+        :type failed: bool
+        """
+        for measure, value in measurements.items():
+            self.observe(name, measure, value)
+        with self._lock:
+            stats = self._stats(name)
+            stats["calls"] += 1
+            stats["errors"] += failed
+            stats["recent_inputs"].append((measurements["seconds"], inputs))
+
+    def _snapshot(self) -> dict:
+        """
+        Copies the measurements of every callback, sorted by name, so they can be read without the lock
+        """
+        with self._lock:
+            return {
+                name: {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "sums": dict(stats["sums"]),
+                    "counts": dict(stats["counts"]),
+                    "recent": {measure: list(values) for measure, values in stats["recent"].items()},
+                    "recent_inputs": list(stats["recent_inputs"]),
+                }
+                for name, stats in sorted(self._callbacks.items())
+            }
+
+    def summary(self, slowest: int = 5) -> dict:
+        """
+        Rolling view of every callback: number of calls and errors, p50/p95/p99 of each measure
+        over the recent calls, and the inputs of the slowest recent calls.
+
+        :param slowest: number of slowest calls listed per callback
+        :type slowest: int
+
+        :return: a dictionary per callback name
+        """
+        callbacks = self._snapshot()
+        summary = {}
+        for name, stats in callbacks.items():
+            slowest_calls = sorted(stats["recent_inputs"], key=lambda call: call[0], reverse=True)[:slowest]
+            summary[name] = {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                **{measure: _quantiles(values) for measure, values in stats["recent"].items() if values},
+                "slowest": [{"seconds": seconds, "inputs": list(inputs)} for seconds, inputs in slowest_calls],
+            }
+        return summary
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the measurements in the Prometheus text format: a counter of calls and errors,
+        and a summary per measure with quantiles over the recent calls.
+
+        :return: the text of a /metrics response
+        """
+        callbacks = self._snapshot()
+
+        lines = [
+            "# HELP dashboard_callback_calls_total Number of callback calls",
+            "# TYPE dashboard_callback_calls_total counter",
+        ]
+        lines += [f'dashboard_callback_calls_total{{callback="{name}"}} {stats["calls"]}'
+                  for name, stats in callbacks.items()]
+        lines += [
+            "# HELP dashboard_callback_errors_total Number of callback calls that raised an error",
+            "# TYPE dashboard_callback_errors_total counter",
+        ]
+        lines += [f'dashboard_callback_errors_total{{callback="{name}"}} {stats["errors"]}'
+                  for name, stats in callbacks.items()]
+
+        for measure, description in MEASURES.items():
+            metric = f"dashboard_callback_{measure}"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} summary"]
+            for name, stats in callbacks.items():
+                if not stats["counts"][measure]:
+                    continue
+                for quantile, value in zip(QUANTILES, np.quantile(stats["recent"][measure], QUANTILES)):
+                    lines.append(f'{metric}{{callback="{name}",quantile="{quantile}"}} {value:.6g}')
+                lines.append(f'{metric}_sum{{callback="{name}"}} {stats["sums"][measure]:.6g}')
+                lines.append(f'{metric}_count{{callback="{name}"}} {stats["counts"][measure]}')
+
+        return "\n".join(lines) + "\n"
+
+
+def _quantiles(values: list) -> dict:
+    """
+    Returns p50, p95 and p99 of values
+    """
+    return {f"p{round(quantile * 100)}": value for quantile, value in zip(QUANTILES, np.quantile(values, QUANTILES))}
+
+
+# measurements of all instrumented callbacks in this process
+metrics = CallbackMetrics()
+
+
+def instrument(callback):
+    """
+    Decorator that records wall time, phase times, peak memory and inputs of every call in metrics.
+    Put it below @app.callback, so Dash registers the instrumented function.
+    PreventUpdate is not counted as an error.
+
+    :param callback: the callback function
+    :type callback: Callable
+
+    :return: the instrumented callback
+    """
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    def instrumented(*args, **kwargs):
+        phases = {}
+        token = _current_call.set(phases)
+        memory_start = _start_memory_trace()
+        failed = False
+        start = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            measurements = {"seconds": time.perf_counter() - start}
+            _current_call.reset(token)
+            for phase_name, seconds in phases.items():
+                measurements[f"{phase_name}_seconds"] = seconds
+            if memory_start is not None:
+                measurements["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1] - memory_start
+
+            metrics.record_call(name, measurements, args, failed)
+            _set_request_callback_name(name)
+            logger.info("callback=%s inputs=%r %s", name, args,
+                        " ".join(f"{measure}={value:.4g}" for measure, value in measurements.items()))
+
+    return instrumented
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Marks a part of an instrumented callback as phase name ("data" or "figure").
+    The time is added to the phase, so a phase can be entered more than once per call.
+
+    :param name: name of the phase
+    :type name: str
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = _current_call.get()
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def _start_memory_trace() -> int | None:
+    """
+    Resets the traced memory peak and returns the current traced memory, or None if tracemalloc isn't running
+    """
+    if not tracemalloc.is_tracing():
+        return None
+    tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _set_request_callback_name(name: str):
+    """
+    Stores the callback name on the Flask request, so the response size can be recorded for it
+    """
+    if flask.has_request_context():
+        flask.g.callback_name = name
@@ -0,0 +1,198 @@
+"""
+Startup precomputation of section data as tasks on a pool of threads or processes.
+
+Each task names the tasks it depends on and is started as soon as they are done, so independent
+sections (forecast error, promotions, supplier statistics, inventory, sales) are built at the same time.
+
+Threads are the default: they share the cache directly, and most of the work is in numpy and pandas,
+which release the GIL for much of it.
+With processes, workers are forked from the process that loaded the data set and share it copy-on-write.
+A worker sends the result of its task back, pickled, and the result is stored in the cache of this process
+(Task.store); before a task runs in a worker, the results of its dependencies are stored in that worker's
+cache the same way, so the task finds them there instead of building them again. The results are large
+(about 38 MB for 1M rows, half of it the RQ4 inventory index), so processes only pay off when there are
+enough CPUs for the parallel builds to save more than the copying costs.
+"""
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable
+
+logger = logging.getLogger("dashboard.precompute")
+
+EXECUTORS = ("process", "thread")
+
+# tasks of the running pipeline, by name - read by worker processes, which are forked after it is set
+_tasks = {}
+
+
+@dataclass(frozen=True)
+class Task:
+    """
+    One piece of section data to build:
+    - name: unique name of the task
+    - build: function without arguments that builds the value (and caches it in the process it runs in)
+    - store: function that stores a value built in another process in the cache of this process
+    - depends_on: names of the tasks whose values build reads
+    """
+
+    name: str
+    build: Callable[[], Any]
+    store: Callable[[Any], None]
+    depends_on: tuple[str, ...] = ()
+
+
+def run_tasks(tasks: list[Task], max_workers: int | None = None, executor: str = "thread") -> dict[str, dict]:
+    """
+    Runs tasks on a pool, each one after the tasks it depends on, and logs the time of every task.
+    An error in a task is raised after the running tasks have finished; tasks not started yet are skipped.
+
+    :param tasks: the tasks
+    :type tasks: list[Task]
+
+    :param max_workers: number of workers, default the number of CPUs. With 1, tasks run one after
+    another in this process
+    :type max_workers: int | None
+
+    :param executor: 'thread' or 'process'. Processes need the fork start method, without it threads are used
+    :type executor: str
+
+    :return: per task name, start (seconds after the pipeline started), seconds and worker (process id)
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor must be one of {EXECUTORS}, not {executor!r}")
+    order = _sort_tasks(tasks)
+    max_workers = max_workers or os.cpu_count() or 1
+    if executor == "process" and "fork" not in multiprocessing.get_all_start_methods():
+        executor = "thread"
+
+    start = time.perf_counter()
+    if max_workers == 1:
+        timings = {}
+        for task in order:
+            task_start = time.perf_counter()
+            task.build()
+            timings[task.name] = {
+                "start": task_start - start, "seconds": time.perf_counter() - task_start, "worker": os.getpid()
+            }
+    elif executor == "process":
+        timings = _run_on_pool(order, ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("fork")),
+                               processes=True, start=start)
+    else:
+        timings = _run_on_pool(order, ThreadPoolExecutor(max_workers, thread_name_prefix="precompute"),
+                               processes=False, start=start)
+
+    elapsed = time.perf_counter() - start
+    for name, timing in sorted(timings.items(), key=lambda item: item[1]["start"]):
+        logger.info("task=%s start=%.3f seconds=%.3f worker=%s", name, timing["start"], timing["seconds"], timing["worker"])
+    logger.info(
+        "%d tasks in %.3f seconds on %d %s worker(s), %.3f seconds of task time",
+        len(timings), elapsed, max_workers, executor if max_workers > 1 else "serial",
+        sum(timing["seconds"] for timing in timings.values()),
+    )
+    return timings
+
+
+def _run_on_pool(order: list[Task], pool, processes: bool, start: float) -> dict[str, dict]:
+    """
+    Submits every task whose dependencies are done, until all tasks are done
+    """
+    global _tasks
+    tasks = {task.name: task for task in order}
+    remaining = {task.name: set(task.depends_on) for task in order}
+    dependents = {task.name: [other.name for other in order if task.name in other.depends_on] for task in order}
+    # values of finished tasks, kept for the worker processes of tasks that depend on them
+    values = {}
+    timings = {}
+    running: dict[Future, str] = {}
+    error = None
+
+    _tasks = tasks
+    try:
+        with pool:
+            while remaining or running:
+                if error is None:
+                    for name in [name for name, depends_on in remaining.items() if not depends_on]:
+                        del remaining[name]
+                        if processes:
+                            dependencies = {dependency: values[dependency] for dependency in tasks[name].depends_on}
+                            running[pool.submit(_run_in_worker, name, dependencies)] = name
+                        else:
+                            running[pool.submit(_run_timed, tasks[name].build)] = name
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        value, task_start, seconds, worker = future.result()
+                    except Exception as exception:
+                        logger.error("task=%s failed: %r", name, exception)
+                        error = error or exception
+                        continue
+
+                    if processes:
+                        tasks[name].store(value)
+                        if dependents[name]:
+                            values[name] = value
+                    timings[name] = {"start": task_start - start, "seconds": seconds, "worker": worker}
+                    for dependent in dependents[name]:
+                        if dependent in remaining:
+                            remaining[dependent].discard(name)
+    finally:
+        _tasks = {}
+
+    if error is not None:
+        raise error
+    return timings
+
+
+def _run_timed(build: Callable[[], Any]) -> tuple[Any, float, float, int]:
+    """
+    Runs build and returns its value, start time, duration and process id
+    """
+    task_start = time.perf_counter()
+    value = build()
+    return value, task_start, time.perf_counter() - task_start, os.getpid()
+
+
+def _run_in_worker(name: str, dependencies: dict) -> tuple[Any, float, float, int]:
+    """
+    Runs a task in a worker process, after storing the values of its dependencies in the worker's cache
+    """
+    for dependency, value in dependencies.items():
+        _tasks[dependency].store(value)
+    return _run_timed(_tasks[name].build)
+
+
+def _sort_tasks(tasks: list[Task]) -> list[Task]:
+    """
+    Returns the tasks in an order where every task comes after its dependencies.
+    Raises ValueError for duplicate names, unknown dependencies and cycles.
+    """
+    by_name = {}
+    for task in tasks:
+        if task.name in by_name:
+            raise ValueError(f"Duplicate task {task.name!r}")
+        by_name[task.name] = task
+    for task in tasks:
+        unknown = set(task.depends_on) - by_name.keys()
+        if unknown:
+            raise ValueError(f"Task {task.name!r} depends on unknown tasks {sorted(unknown)}")
+
+    order = []
+    done = set()
+    remaining = list(tasks)
+    while remaining:
+        ready = [task for task in remaining if set(task.depends_on) <= done]
+        if not ready:
+            raise ValueError(f"Tasks depend on each other in a cycle: {sorted(task.name for task in remaining)}")
+        order += ready
+        done |= {task.name for task in ready}
+        remaining = [task for task in remaining if task.name not in done]
+    return order
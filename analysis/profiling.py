@@ -0,0 +1,144 @@
+"""
+Startup profiling: time spent importing modules and initializing the app.
+
+Run it with
+    python -m analysis.profiling
+It starts "import main" in a new interpreter with -X importtime and DASHBOARD_PROFILE_STARTUP=1,
+and prints the import time per package and per module, and the time of each initialization phase
+recorded in main.py with mark_phase.
+
+This module only uses the standard library, so importing it first in main.py doesn't change what it measures.
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger("dashboard.startup")
+
+# (phase name, seconds) in the order the phases finished
+_phases = []
+_phase_start = time.perf_counter()
+
+
+def mark_phase(name: str):
+    """
+    Records the time since the previous phase (or since this module was imported) as phase name.
+
+    :param name: name of the phase that just finished, e.g. "load data"
+    :type name: str
+    """
+    global _phase_start
+    now = time.perf_counter()
+    _phases.append((name, now - _phase_start))
+    _phase_start = now
+
+
+def log_phases():
+    """
+    Logs the recorded phases when DASHBOARD_PROFILE_STARTUP=1, one line per phase
+    """
+    if os.environ.get("DASHBOARD_PROFILE_STARTUP") != "1":
+        return
+    for name, seconds in _phases:
+        logger.info("phase=%r seconds=%.3f", name, seconds)
+
+
+def parse_importtime(output: str) -> list[dict]:
+    """
+    Parses the output of python -X importtime.
+
+    :param output: stderr of a python process started with -X importtime
+    :type output: str
+
+    :return: a list with a dictionary per imported module, with keys module, package (the top level package),
+    self_seconds and cumulative_seconds
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        module = module.strip()
+        imports.append(
+            {
+                "module": module,
+                "package": module.split(".")[0],
+                "self_seconds": int(self_us) / 1e6,
+                "cumulative_seconds": int(cumulative_us) / 1e6,
+            }
+        )
+    return imports
+
+
+def summarize_imports(imports: list[dict], top_n: int = 15) -> dict[str, list[tuple[str, float]]]:
+    """
+    Sums import time per top level package, and finds the modules that take the longest themselves.
+    Times per package add up the self time of its modules, so a package imported from several
+    places is counted once in total.
+
+    :param imports: result of parse_importtime
+    :type imports: list[dict]
+
+    :param top_n: number of packages and modules to keep
+    :type top_n: int
+
+    :return: a dictionary with "packages" and "modules", each a list of (name, seconds), slowest first
+    """
+    packages = {}
+    for module in imports:
+        packages[module["package"]] = packages.get(module["package"], 0) + module["self_seconds"]
+
+    modules = [(module["module"], module["self_seconds"]) for module in imports]
+    return {
+        "packages": sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top_n],
+        "modules": sorted(modules, key=lambda item: item[1], reverse=True)[:top_n],
+    }
+
+
+def profile_startup(module: str = "main", top_n: int = 15) -> str:
+    """
+    Imports module in a new interpreter and reports import and initialization times.
+
+    :param module: module to import, e.g. "main"
+    :type module: str
+
+    :param top_n: number of packages and modules listed
+    :type top_n: int
+
+    :return: the report as text
+    """
+    code = (
+        "import logging, time; start = time.perf_counter(); "
+        "logging.basicConfig(level=logging.INFO, format='%(name)s %(message)s'); "
+        f"import {module}; "
+        "logging.getLogger('dashboard.startup').info('phase=%r seconds=%.3f', 'total', time.perf_counter() - start)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env={**os.environ, "DASHBOARD_PROFILE_STARTUP": "1"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = parse_importtime(result.stderr)
+    summary = summarize_imports(imports, top_n)
+    total_import = sum(module["self_seconds"] for module in imports)
+
+    lines = [f"Import time (all modules): {total_import:.3f}s", "", "Packages (sum of module self time):"]
+    lines += [f"  {seconds:8.3f}s  {name}" for name, seconds in summary["packages"]]
+    lines += ["", "Modules (self time):"]
+    lines += [f"  {seconds:8.3f}s  {name}" for name, seconds in summary["modules"]]
+    lines += ["", "Initialization phases:"]
+    lines += [
+        "  " + line.removeprefix("dashboard.startup ")
+        for line in result.stderr.splitlines()
+        if line.startswith("dashboard.startup ")
+    ]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(profile_startup(sys.argv[1] if len(sys.argv) > 1 else "main"))
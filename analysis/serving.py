@@ -0,0 +1,128 @@
+"""
+Helpers for serving the dashboard: response size logging per callback, the data refresh endpoint
+and the callback metrics endpoints.
+"""
+
+import hmac
+import logging
+import os
+import signal
+
+import flask
+
+import analysis.cache as cache
+import analysis.dataset as dataset
+import analysis.instrumentation as instrumentation
+
+logger = logging.getLogger("dashboard.payload")
+
+
+def log_callback_payload_sizes(server: flask.Flask):
+    """
+    Logs the response size of every Dash callback, before and after compression.
+    The hook that reads the compressed size is moved to the front of Flask's after_request list,
+    because Flask runs those functions in reverse order and compression is registered by Dash first.
+
+    :param server: the Flask server of the Dash app (app.server)
+    :type server: flask.Flask
+    """
+
+    def record_payload_size(response: flask.Response) -> flask.Response:
+        if _is_callback_request():
+            flask.g.payload_bytes = response.calculate_content_length()
+            # set by instrumentation.instrument when the callback is instrumented
+            if "callback_name" in flask.g and flask.g.payload_bytes is not None:
+                instrumentation.metrics.observe(flask.g.callback_name, "payload_bytes", flask.g.payload_bytes)
+        return response
+
+    def log_payload_size(response: flask.Response) -> flask.Response:
+        if _is_callback_request():
+            payload = flask.request.get_json(silent=True) or {}
+            logger.info(
+                "callback=%s payload_bytes=%s sent_bytes=%s encoding=%s",
+                payload.get("output"),
+                flask.g.get("payload_bytes"),
+                response.calculate_content_length(),
+                response.headers.get("Content-Encoding", "identity"),
+            )
+        return response
+
+    server.after_request(record_payload_size)
+    server.after_request_funcs.setdefault(None, []).insert(0, log_payload_size)
+
+
+def _is_callback_request() -> bool:
+    """
+    Checks if the current request is a Dash callback
+    """
+    return flask.request.path.endswith("/_dash-update-component")
+
+
+def add_refresh_endpoint(server: flask.Flask, dataset_store):
+    """
+    Adds POST /admin/refresh, which loads new rows into the data set (dataset_store.refresh).
+    The request needs the header "Authorization: Bearer <token>" with the token in DASHBOARD_ADMIN_TOKEN.
+    Without DASHBOARD_ADMIN_TOKEN the endpoint answers every request with 403.
+
+    Loading the rows in the process that gets the request is for a single process only.
+    Under gunicorn (gunicorn.conf.py), server.config["DASHBOARD_MASTER_PID"] is set in every worker:
+    if there is new data (has_new_data), the request sends SIGHUP to the master, which loads the new rows
+    once and replaces all workers, so every worker serves the same version and they keep sharing one copy
+    of the data. The response (202) has the version served before the reload.
+
+    :param server: the Flask server of the Dash app (app.server)
+    :type server: flask.Flask
+
+    :param dataset_store: the store holding the served data set
+    :type dataset_store: analysis.dataset.DatasetStore
+    """
+
+    @server.route("/admin/refresh", methods=["POST"])
+    def refresh_dataset():
+        _check_admin_token()
+        master_pid = server.config.get("DASHBOARD_MASTER_PID")
+        if master_pid:
+            data = dataset_store.current
+            if not dataset.has_new_data(data):
+                return flask.jsonify(refreshed=False, version=data.version, rows=len(data.data))
+            os.kill(master_pid, signal.SIGHUP)
+            return flask.jsonify(reloading=True, version=data.version, rows=len(data.data)), 202
+
+        refreshed = dataset_store.refresh()
+        data = dataset_store.current
+        return flask.jsonify(refreshed=refreshed, version=data.version, rows=len(data.data))
+
+
+def add_metrics_endpoints(server: flask.Flask, metrics: instrumentation.CallbackMetrics = instrumentation.metrics):
+    """
+    Adds the callback measurements of instrumentation.instrument:
+    - GET /metrics - Prometheus text format, with the hit and miss counters of the named caches
+    - GET /metrics/callbacks - JSON with p50/p95/p99 per callback and the inputs of the slowest recent calls
+    Both need the header "Authorization: Bearer <token>" with the token in DASHBOARD_ADMIN_TOKEN, because
+    the slowest calls include callback inputs. Without DASHBOARD_ADMIN_TOKEN they answer every request with 403.
+
+    :param server: the Flask server of the Dash app (app.server)
+    :type server: flask.Flask
+
+    :param metrics: the measurements to report
+    :type metrics: instrumentation.CallbackMetrics
+    """
+
+    @server.route("/metrics")
+    def prometheus_metrics():
+        _check_admin_token()
+        return flask.Response(metrics.to_prometheus() + cache.to_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    @server.route("/metrics/callbacks")
+    def callback_metrics():
+        _check_admin_token()
+        return flask.jsonify(metrics.summary())
+
+
+def _check_admin_token():
+    """
+    Aborts the request with 403 if it doesn't carry DASHBOARD_ADMIN_TOKEN, or if DASHBOARD_ADMIN_TOKEN is not set
+    """
+    token = os.environ.get("DASHBOARD_ADMIN_TOKEN")
+    if not token or not hmac.compare_digest(flask.request.headers.get("Authorization", ""), f"Bearer {token}"):
+        flask.abort(403)
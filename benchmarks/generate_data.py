@@ -0,0 +1,188 @@
+"""
+Synthetic data set with the columns of data/supply_chain_dataset1.csv.
+
+    python -m benchmarks.generate_data --rows 1000000 --output data/synthetic_1m.csv
+
+The values follow simple patterns, so the dashboard shows something meaningful:
+- a few products sell much more than the rest, each product has its own price and cost
+- sales are seasonal, and higher with a promotion (which also lowers the price)
+- the demand forecast is the expected demand with noise
+- every supplier has its own typical lead time and spread
+- a small share of rows are exact duplicates, and a few values are missing
+Rows are written in chunks, so the scale (10k to 50M rows) only changes the file size, not the memory used.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+REGIONS = ["North", "South", "East", "West"]
+COLUMNS = [
+    "Date",
+    "SKU_ID",
+    "Warehouse_ID",
+    "Supplier_ID",
+    "Region",
+    "Units_Sold",
+    "Inventory_Level",
+    "Supplier_Lead_Time_Days",
+    "Reorder_Point",
+    "Order_Quantity",
+    "Unit_Cost",
+    "Unit_Price",
+    "Promotion_Flag",
+    "Stockout_Flag",
+    "Demand_Forecast",
+]
+
+
+def generate_data(
+    rows: int,
+    products: int = 50,
+    warehouses: int = 5,
+    suppliers: int = 7,
+    start_date: str = "2023-01-01",
+    end_date: str = "2024-12-31",
+    duplicate_share: float = 0.005,
+    missing_share: float = 0.001,
+    chunk_rows: int = 1_000_000,
+    seed: int = 0,
+):
+    """
+    Generates the data set in chunks.
+
+    :param rows: number of rows, including duplicates
+    :type rows: int
+
+    :param products: number of products (SKU_1 ... SKU_<products>)
+    :type products: int
+
+    :param warehouses: number of warehouses
+    :type warehouses: int
+
+    :param suppliers: number of suppliers
+    :type suppliers: int
+
+    :param start_date: first date
+    :type start_date: str
+
+    :param end_date: last date
+    :type end_date: str
+
+    :param duplicate_share: share of rows that repeat an earlier row of the same chunk
+    :type duplicate_share: float
+
+    :param missing_share: share of missing values in Region, Units_Sold and Supplier_Lead_Time_Days
+    :type missing_share: float
+
+    :param chunk_rows: number of rows per chunk
+    :type chunk_rows: int
+
+    :param seed: random seed, the same seed and parameters give the same data
+    :type seed: int
+
+    :return: generator of dataframes with the CSV columns
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start_date, end_date, freq="D")
+
+    # per product: popularity (Zipf-like), price, margin and supplier
+    popularity = 1 / np.arange(1, products + 1) ** 0.8
+    popularity = rng.permutation(popularity / popularity.sum())
+    base_price = rng.uniform(10, 100, products)
+    margin = rng.uniform(0.1, 0.5, products)
+    product_supplier = rng.integers(1, suppliers + 1, products)
+    base_demand = 40 + 260 * popularity / popularity.max()
+
+    # per supplier: typical lead time and how much it varies
+    lead_time_mean = rng.uniform(5, 25, suppliers + 1)
+    lead_time_spread = rng.uniform(1, 6, suppliers + 1)
+
+    for chunk_start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - chunk_start)
+        product = rng.choice(products, n, p=popularity)
+        date = dates[rng.integers(0, len(dates), n)]
+        promotion = rng.random(n) < 0.2
+
+        # expected demand: product level, yearly season and promotion uplift
+        season = 1 + 0.3 * np.sin(2 * np.pi * (date.dayofyear.to_numpy() - 80) / 365)
+        expected = base_demand[product] * season * np.where(promotion, 1.3, 1.0)
+        units_sold = rng.poisson(expected)
+
+        supplier = product_supplier[product]
+        lead_time = np.clip(
+            np.rint(rng.normal(lead_time_mean[supplier], lead_time_spread[supplier])), 1, 60
+        ).astype(int)
+        reorder_point = np.rint(expected / 7 * lead_time_mean[supplier] * rng.uniform(0.6, 1.4, n)).astype(int)
+        inventory = np.maximum(rng.normal(3 * expected, expected), 0).astype(int)
+        price = base_price[product] * np.where(promotion, 0.85, 1.0) * rng.uniform(0.95, 1.05, n)
+
+        chunk = pd.DataFrame(
+            {
+                "Date": date.strftime("%Y-%m-%d"),
+                "SKU_ID": "SKU_" + pd.Series(product + 1).astype(str),
+                "Warehouse_ID": "WH_" + pd.Series(rng.integers(1, warehouses + 1, n)).astype(str),
+                "Supplier_ID": "SUP_" + pd.Series(supplier).astype(str),
+                "Region": np.array(REGIONS, dtype=object)[rng.integers(0, len(REGIONS), n)],
+                "Units_Sold": units_sold,
+                "Inventory_Level": inventory,
+                "Supplier_Lead_Time_Days": lead_time,
+                "Reorder_Point": reorder_point,
+                "Order_Quantity": np.rint(expected * rng.uniform(1, 3, n)).astype(int),
+                "Unit_Cost": (base_price[product] * (1 - margin[product])).round(2),
+                "Unit_Price": price.round(2),
+                "Promotion_Flag": promotion.astype(int),
+                "Stockout_Flag": (inventory < units_sold).astype(int),
+                "Demand_Forecast": (expected * rng.normal(1, 0.15, n)).clip(0).round(2),
+            },
+            columns=COLUMNS,
+        )
+
+        # nullable integers, so columns with a missing value are still written as integers
+        chunk = chunk.astype({"Units_Sold": "Int64", "Supplier_Lead_Time_Days": "Int64"})
+        for column in ["Region", "Units_Sold", "Supplier_Lead_Time_Days"]:
+            chunk.loc[rng.random(n) < missing_share, column] = None
+
+        # some rows repeat another row of the chunk, in place of their own values
+        source_rows = np.arange(n)
+        duplicates = rng.random(n) < duplicate_share
+        source_rows[duplicates] = rng.integers(0, n, duplicates.sum())
+
+        yield chunk.iloc[source_rows].reset_index(drop=True)
+
+
+def write_csv(path: str, rows: int, **kwargs):
+    """
+    Writes a generated data set to a CSV file, chunk by chunk.
+
+    :param path: path of the CSV file
+    :type path: str
+
+    :param rows: number of rows
+    :type rows: int
+
+    :param kwargs: other parameters of generate_data
+    """
+    for chunk_number, chunk in enumerate(generate_data(rows, **kwargs)):
+        chunk.to_csv(path, mode="w" if chunk_number == 0 else "a", header=chunk_number == 0, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--warehouses", type=int, default=5)
+    parser.add_argument("--suppliers", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_csv(
+        args.output,
+        args.rows,
+        products=args.products,
+        warehouses=args.warehouses,
+        suppliers=args.suppliers,
+        seed=args.seed,
+    )
@@ -0,0 +1,403 @@
+"""
+Times data preparation and every RQ data function and figure builder on synthetic data sets.
+
+    python -m benchmarks.run_benchmarks                          # compare with benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --save-baseline          # store the results as the new baseline
+    python -m benchmarks.run_benchmarks --scales 10000 50000000  # other data set sizes
+
+Data sets are generated once per scale (benchmarks.generate_data) and kept in --data-dir.
+Each benchmark reports the fastest of --repeat runs. A benchmark is a regression when it is more than
+--tolerance slower than the baseline and at least --min-seconds slower, so tiny timings don't fail on noise.
+The exit code is 1 if there is a regression or a benchmark without a baseline, so the comparison can run before a deploy.
+
+    python -m benchmarks.run_benchmarks --check                  # also check streaming against in-memory results
+
+--check compares dm.stream_aggregates at several chunk sizes with dm.aggregate_chunk of the deduplicated data set
+and exits with 1 if they differ.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly
+
+import analysis.analysis_rq1 as rq1
+import analysis.analysis_rq2 as rq2
+import analysis.analysis_rq3 as rq3
+import analysis.analysis_rq4 as rq4
+import analysis.analysis_rq5 as rq5
+import analysis.data_modelling as dm
+import analysis.date_index as di
+import analysis.figures as figures
+import benchmarks.generate_data as generate_data
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+
+
+def prepare_inputs(csv_path: str) -> dict:
+    """
+    Loads a data set and builds the inputs the benchmarks need (not timed).
+
+    :param csv_path: path to a CSV file with the columns of the data set
+    :type csv_path: str
+
+    :return: a dictionary with the raw, cleaned and typed data, aggregates and RQ data structures
+    """
+    raw = pd.read_csv(csv_path)
+    cleaned = dm.clean_data(raw)
+    data = dm.add_derived_columns(dm.changing_columns_name_values(cleaned.copy()))
+    aggregates = dm.aggregate_chunk(data)
+    regions = dm.get_unique_region(data)
+    first = data.iloc[0]
+    sorted_data = data.iloc[di.sort_by_date(data["date"])].reset_index(drop=True)
+    date_index = di.build_date_index(sorted_data["date"])
+    days = date_index.days
+
+    return {
+        "csv_path": csv_path,
+        "raw": raw,
+        "cleaned": cleaned,
+        "data": data,
+        "aggregates": aggregates,
+        "regions": regions,
+        "product_id": first["product_id"],
+        "warehouse_id": first["warehouse_id"],
+        "error_table": rq1.build_forecast_error_table(data),
+        "promotion_intervals": rq2.get_promotion_intervals(data),
+        "promotion_cube": rq2.build_promotion_cube(aggregates["promotions"]),
+        "sorted_data": sorted_data,
+        "date_index": date_index,
+        "prefix_sums": {
+            name: di.build_prefix_sums(sorted_data, date_index, *dm.DAILY_AGGREGATES[name])
+            for name in ["forecast_error", "promotions"]
+        },
+        # the middle half of the days, like a date range picked on the dashboard
+        "date_range": (days[len(days) // 4], days[len(days) * 3 // 4]),
+        "lead_time_stats": rq3.build_lead_time_stats(
+            aggregates["supplier_lead_time"][("supplier_lead_time_days", "count")]
+        ),
+        "inventory_index": rq4.build_inventory_index(data),
+        "sales_cube": rq5.build_sales_cube(data, regions),
+        "top_products": rq5.get_top_n_products_sold(data, 5),
+    }
+
+
+# name -> function of the inputs that is timed
+BENCHMARKS = {
+    # data preparation
+    "read_csv": lambda inputs: pd.read_csv(inputs["csv_path"]),
+    "clean_data": lambda inputs: dm.clean_data(inputs["raw"]),
+    "changing_columns_name_values": lambda inputs: dm.changing_columns_name_values(inputs["cleaned"]),
+    "add_derived_columns": lambda inputs: dm.add_derived_columns(inputs["data"]),
+    "aggregate_chunk": lambda inputs: dm.aggregate_chunk(inputs["data"]),
+    "remove_seen_rows": lambda inputs: dm.remove_seen_rows(inputs["data"], np.empty(0, dtype=np.uint64)),
+    # RQ1
+    "rq1.create_static_line_chart": lambda inputs: rq1.create_static_line_chart(inputs["data"]),
+    "rq1.build_forecast_error_table": lambda inputs: rq1.build_forecast_error_table(inputs["data"]),
+    "rq1.build_forecast_error_table_from_sums": lambda inputs: rq1.build_forecast_error_table_from_sums(
+        inputs["aggregates"]["forecast_error"][("abs_difference", "sum")]
+    ),
+    "rq1.get_worst_performing": lambda inputs: rq1.get_worst_performing(
+        inputs["error_table"], "All Warehouses", "All Regions"
+    ),
+    "rq1.plot_worst_performing": lambda inputs: rq1.plot_worst_performing(
+        rq1.get_worst_performing(inputs["error_table"], "All Warehouses", "All Regions")
+    ),
+    "rq1.create_promo_box_plot": lambda inputs: rq1.create_promo_box_plot(inputs["data"], aggregate=True),
+    # date range
+    "di.build_prefix_sums": lambda inputs: di.build_prefix_sums(
+        inputs["sorted_data"], inputs["date_index"], *dm.DAILY_AGGREGATES["forecast_error"]
+    ),
+    "di.PrefixSums.range_sums": lambda inputs: inputs["prefix_sums"]["forecast_error"].range_sums(
+        *inputs["date_range"]
+    ),
+    "di.PrefixSums.range_sums_by_month": lambda inputs: inputs["prefix_sums"]["promotions"].range_sums(
+        *inputs["date_range"], by_month=True
+    ),
+    # one point per row, downsampled to the points of the RQ1 line chart
+    "figures.lttb": lambda inputs: figures.lttb(
+        np.arange(len(inputs["data"])), inputs["data"]["demand_forecast"].to_numpy(), 1500
+    ),
+    # RQ2
+    "rq2.plot_avg_units_sold": lambda inputs: rq2.plot_avg_units_sold(inputs["data"]),
+    "rq2.plot_avg_profit": lambda inputs: rq2.plot_avg_profit(inputs["data"]),
+    "rq2.plot_promotions_by_region": lambda inputs: rq2.plot_promotions_by_region(inputs["data"]),
+    "rq2.build_promotion_cube": lambda inputs: rq2.build_promotion_cube(inputs["aggregates"]["promotions"]),
+    "rq2.select_promotions": lambda inputs: rq2.select_promotions(
+        inputs["promotion_cube"], sorted(inputs["regions"])[:2], None, 3, 9
+    ),
+    "rq2.get_promotion_intervals": lambda inputs: rq2.get_promotion_intervals(inputs["data"]),
+    "rq2.count_concurrent_promotions": lambda inputs: rq2.count_concurrent_promotions(
+        inputs["promotion_intervals"]
+    ),
+    # RQ3
+    "rq3.build_lead_time_stats": lambda inputs: rq3.build_lead_time_stats(
+        inputs["aggregates"]["supplier_lead_time"][("supplier_lead_time_days", "count")]
+    ),
+    "rq3.plot_avg_lead_time": lambda inputs: rq3.plot_avg_lead_time(inputs["data"]),
+    "rq3.plot_avg_lead_time_from_stats": lambda inputs: rq3.plot_avg_lead_time_from_stats(
+        inputs["lead_time_stats"]
+    ),
+    "rq3.plot_lead_time_box": lambda inputs: rq3.plot_lead_time_box(inputs["data"], aggregate=True),
+    "rq3.supplier_summary_table": lambda inputs: rq3.supplier_summary_table(inputs["data"]),
+    "rq3.supplier_summary_table_from_stats": lambda inputs: rq3.supplier_summary_table_from_stats(
+        inputs["lead_time_stats"]
+    ),
+    "rq3.plot_lead_time_vs_inventory": lambda inputs: rq3.plot_lead_time_vs_inventory(inputs["data"]),
+    # RQ4
+    "rq4.build_inventory_index": lambda inputs: rq4.build_inventory_index(inputs["data"]),
+    "rq4.plot_inventory_vs_sales_time": lambda inputs: rq4.plot_inventory_vs_sales_time(
+        inputs["data"], inputs["product_id"], inputs["warehouse_id"], index=inputs["inventory_index"]
+    ),
+    "rq4.plot_weeks_of_inventory_cover": lambda inputs: rq4.plot_weeks_of_inventory_cover(inputs["data"]),
+    "rq4.plot_reorder_point_vs_leadtime_demand": lambda inputs: rq4.plot_reorder_point_vs_leadtime_demand(
+        inputs["data"]
+    ),
+    # RQ5
+    "rq5.get_top_n_products_sold": lambda inputs: rq5.get_top_n_products_sold(inputs["data"], 5),
+    "rq5.get_sale_performance_for_products_across_regions": lambda inputs: (
+        rq5.get_sale_performance_for_products_across_regions(inputs["data"], inputs["top_products"], inputs["regions"])
+    ),
+    "rq5.get_demand_per_month": lambda inputs: rq5.get_demand_per_month(
+        inputs["data"], inputs["top_products"], 1, 12
+    ),
+    "rq5.build_sales_cube": lambda inputs: rq5.build_sales_cube(inputs["data"], inputs["regions"]),
+    "rq5.build_sales_cube_from_sums": lambda inputs: rq5.build_sales_cube_from_sums(
+        inputs["aggregates"]["sales"][("units_sold", "sum")], inputs["regions"]
+    ),
+    "rq5.get_top_n_products_sold_from_cube": lambda inputs: rq5.get_top_n_products_sold_from_cube(
+        inputs["sales_cube"], 5
+    ),
+    "rq5.plot_sale_performance_for_products_across_regions": lambda inputs: (
+        rq5.plot_sale_performance_for_products_across_regions(
+            rq5.get_sale_performance_for_products_across_regions_from_cube(
+                inputs["sales_cube"], inputs["top_products"]
+            )
+        )
+    ),
+    "rq5.plot_demand_per_month": lambda inputs: rq5.plot_demand_per_month(
+        rq5.get_demand_per_month_from_cube(inputs["sales_cube"], inputs["top_products"], 1, 12)
+    ),
+}
+
+
+# benchmark -> input it changes in place; the input is copied before every run, outside the timing
+CHANGED_INPUTS = {
+    "changing_columns_name_values": "cleaned",
+    "add_derived_columns": "data",
+}
+
+
+def time_benchmark(name: str, inputs: dict, repeat: int) -> float:
+    """
+    Returns the fastest of repeat runs of a benchmark, in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        run_inputs = inputs
+        if name in CHANGED_INPUTS:
+            run_inputs = {**inputs, CHANGED_INPUTS[name]: inputs[CHANGED_INPUTS[name]].copy()}
+
+        start = time.perf_counter()
+        BENCHMARKS[name](run_inputs)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_benchmarks(scales: list[int], data_dir: str, repeat: int, names: list[str] | None = None) -> dict:
+    """
+    Runs the benchmarks at every scale.
+
+    :param scales: numbers of rows of the generated data sets
+    :type scales: list[int]
+
+    :param data_dir: directory for the generated CSV files
+    :type data_dir: str
+
+    :param repeat: number of runs per benchmark, the fastest is reported
+    :type repeat: int
+
+    :param names: benchmarks to run, or None for all of them
+    :type names: list[str] | None
+
+    :return: a dictionary with the environment and the results, {scale: {benchmark: seconds}}
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    results = {}
+
+    for rows in scales:
+        csv_path = os.path.join(data_dir, f"synthetic_{rows}.csv")
+        if not os.path.exists(csv_path):
+            print(f"generating {csv_path}", file=sys.stderr)
+            generate_data.write_csv(csv_path, rows)
+
+        inputs = prepare_inputs(csv_path)
+        results[str(rows)] = {}
+        for name in BENCHMARKS:
+            if names and name not in names:
+                continue
+            seconds = time_benchmark(name, inputs, repeat)
+            results[str(rows)][name] = seconds
+            print(f"{rows:>10} rows  {seconds:9.4f}s  {name}", file=sys.stderr)
+
+    return {"environment": get_environment(), "results": results}
+
+
+def check_stream_aggregates(csv_path: str, chunksizes: list[int]) -> list[str]:
+    """
+    Compares the aggregates built by streaming the CSV with the aggregates of the whole data set,
+    cleaned, typed and deduplicated like load_dataset does.
+
+    :param csv_path: path to a CSV file with the columns of the data set
+    :type csv_path: str
+
+    :param chunksizes: chunk sizes to stream with
+    :type chunksizes: list[int]
+
+    :return: a message per chunk size and aggregate that differs, empty if all match
+    """
+    data = dm.changing_columns_name_values(dm.clean_data(pd.read_csv(csv_path)))
+    data, _ = dm.remove_seen_rows(data, np.empty(0, dtype=np.uint64))
+    expected = dm.aggregate_chunk(dm.add_derived_columns(data))
+
+    differences = []
+    for chunksize in chunksizes:
+        streamed = dm.stream_aggregates(csv_path, chunksize)
+        for name, aggregate in expected.items():
+            try:
+                # merging chunks turns categorical index levels into plain ones, and sums differ in the last digits
+                pd.testing.assert_frame_equal(
+                    streamed[name].sort_index(), aggregate.sort_index(), check_index_type=False, check_categorical=False
+                )
+            except AssertionError as error:
+                differences.append(f"{csv_path}, chunksize {chunksize}, {name}: {error}")
+    return differences
+
+
+def get_environment() -> dict:
+    """
+    Versions and machine the benchmarks ran on, stored with the results
+    """
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plotly": plotly.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float, min_seconds: float) -> pd.DataFrame:
+    """
+    Compares results with a baseline.
+
+    :param results: result of run_benchmarks
+    :type results: dict
+
+    :param baseline: a stored result of run_benchmarks
+    :type baseline: dict
+
+    :param tolerance: allowed slowdown, e.g. 0.25 for 25%
+    :type tolerance: float
+
+    :param min_seconds: slowdowns smaller than this are never regressions
+    :type min_seconds: float
+
+    :return: a dataframe with columns rows, benchmark, baseline, seconds, ratio, regression and missing,
+    one row per result. missing is True for results without a baseline (e.g. a new or renamed benchmark),
+    their baseline and ratio are NaN
+    """
+    rows = []
+    for scale, timings in results["results"].items():
+        for name, seconds in timings.items():
+            baseline_seconds = baseline["results"].get(scale, {}).get(name)
+            if baseline_seconds is None:
+                rows.append(
+                    {
+                        "rows": int(scale),
+                        "benchmark": name,
+                        "baseline": np.nan,
+                        "seconds": seconds,
+                        "ratio": np.nan,
+                        "regression": False,
+                        "missing": True,
+                    }
+                )
+                continue
+            rows.append(
+                {
+                    "rows": int(scale),
+                    "benchmark": name,
+                    "baseline": baseline_seconds,
+                    "seconds": seconds,
+                    "ratio": seconds / baseline_seconds if baseline_seconds else np.nan,
+                    "regression": seconds > baseline_seconds * (1 + tolerance)
+                    and seconds - baseline_seconds >= min_seconds,
+                    "missing": False,
+                }
+            )
+    return pd.DataFrame(
+        rows, columns=["rows", "benchmark", "baseline", "seconds", "ratio", "regression", "missing"]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--data-dir", default="data/benchmarks")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--benchmarks", nargs="+", help="names of the benchmarks to run (default: all)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-seconds", type=float, default=0.005)
+    parser.add_argument("--check", action="store_true", help="check stream_aggregates before timing")
+    args = parser.parse_args()
+
+    if args.check:
+        differences = []
+        for rows in args.scales:
+            csv_path = os.path.join(args.data_dir, f"synthetic_{rows}.csv")
+            if not os.path.exists(csv_path):
+                os.makedirs(args.data_dir, exist_ok=True)
+                generate_data.write_csv(csv_path, rows)
+            # one chunk, a few chunks and many chunks
+            differences += check_stream_aggregates(csv_path, [rows, rows // 3 + 1, rows // 30 + 1])
+        if differences:
+            print("\n".join(differences))
+            sys.exit(1)
+        print("stream_aggregates matches the in-memory aggregates", file=sys.stderr)
+
+    results = run_benchmarks(args.scales, args.data_dir, args.repeat, args.benchmarks)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"saved baseline to {args.baseline}")
+        sys.exit(0)
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline["environment"] != results["environment"]:
+        print("warning: the baseline was recorded in a different environment", file=sys.stderr)
+
+    comparison = compare_with_baseline(results, baseline, args.tolerance, args.min_seconds)
+    print(comparison.round(4).to_string(index=False))
+    regressions = comparison[comparison["regression"]]
+    missing = comparison[comparison["missing"]]
+    if len(regressions):
+        print(f"\n{len(regressions)} benchmark(s) slower than the baseline")
+    if len(missing):
+        print(f"\n{len(missing)} benchmark(s) without a baseline, run with --save-baseline to record them")
+    if len(regressions) or len(missing):
+        sys.exit(1)
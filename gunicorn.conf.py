@@ -0,0 +1,57 @@
+"""
+gunicorn settings for serving the dashboard with several workers:
+
+    gunicorn -c gunicorn.conf.py main:server
+
+The app is loaded once in the master process, which also builds the data of every section
+(DASHBOARD_PRELOAD=1). Workers are forked from the master and share that memory
+copy-on-write, so a node keeps one copy of the data set whatever the number of workers.
+
+New data is loaded by the master too: POST /admin/refresh in a worker, or the watcher in the master
+(DASHBOARD_REFRESH_SECONDS), sends SIGHUP to the master. On this reload the master loads the new rows
+and builds the sections again, then forks new workers and stops the old ones when their requests are done.
+All workers then serve the same version from one shared copy.
+"""
+
+import gc
+import os
+import signal
+
+os.environ.setdefault("DASHBOARD_PRELOAD", "1")
+
+bind = os.environ.get("DASHBOARD_BIND", "0.0.0.0:8050")
+workers = int(os.environ.get("DASHBOARD_WORKERS", "4"))
+preload_app = True
+
+
+def when_ready(server):
+    # Move everything built so far out of the garbage collector's reach. Otherwise the first
+    # collection in each worker writes to the GC headers of every object, which copies their pages.
+    gc.freeze()
+
+    # the watcher only checks for new data, the master loads it on the reload (on_reload)
+    if os.environ.get("DASHBOARD_REFRESH_SECONDS"):
+        import main
+
+        main.dataset_store.watch(
+            float(os.environ["DASHBOARD_REFRESH_SECONDS"]), on_new_data=lambda: os.kill(server.pid, signal.SIGHUP)
+        )
+
+
+def on_reload(server):
+    # runs in the master on SIGHUP, before the new workers are forked from it
+    import main
+
+    # objects of the old version can only be collected when they are not frozen
+    gc.unfreeze()
+    if main.dataset_store.refresh():
+        main.build_all_sections()
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # refresh requests in a worker ask the master to reload (analysis.serving.add_refresh_endpoint)
+    import main
+
+    main.server.config["DASHBOARD_MASTER_PID"] = server.pid
@@ -1,34 +1,145 @@
+import logging
+import os
+import tracemalloc
+
+# imported first, so the first phase includes the time to import everything below
+import analysis.profiling as profiling
 import dash
 from dash import dcc, html, Input, Output
 import dash_bootstrap_components as dbc
-import pandas as pd
+import analysis.cache as cache
 import analysis.data_modelling as dm
+import analysis.dataset as dataset
+import analysis.date_index as di
+import analysis.figures as figures
+import analysis.instrumentation as instrumentation
+import analysis.precompute as precompute
 import analysis.analysis_rq1 as vis_rq1
 import analysis.analysis_rq2 as vis_rq2
 import analysis.analysis_rq3 as vis_rq3
 import analysis.analysis_rq4 as vis_rq4
 import analysis.analysis_rq5 as vis_rq5
+import analysis.serving as serving
+
+profiling.mark_phase("imports")
+
+# Load the data, cleaned and prepared for analysis
+# (the cleaned data is cached next to the CSV, so only the first start after a change reads the CSV).
+# Forecast error, profit and promotion labels are added to the data once and read by all sections,
+# instead of each section keeping its own copy of the data set.
+# New rows appended to the CSV or new files in data/partitions are loaded by dataset_store.refresh(),
+# which swaps in a new version - callbacks read dataset_store.current once per request.
+data_path = "data/supply_chain_dataset1.csv"
+partition_dir = "data/partitions"
+dataset_store = dataset.DatasetStore(dataset.load_dataset(data_path, partition_dir))
+profiling.mark_phase("load data")
+
+# Section data and static figures are built on first access and reused for this dataset version,
+# so starting the app doesn't wait for sections nobody has opened yet
+section_cache = cache.LRUCache(max_entries=64, name="sections")
+
+# Results of the dropdown callbacks, keyed by their inputs and the dataset version, so a repeated
+# selection is a lookup. Entries expire after DASHBOARD_CALLBACK_CACHE_TTL seconds (default 600).
+# DASHBOARD_CACHE_DIR=<directory> also stores them as files there, shared by all gunicorn workers
+callback_cache_ttl = float(os.environ.get("DASHBOARD_CALLBACK_CACHE_TTL", 600))
+callback_cache = cache.LRUCache(
+    max_entries=256,
+    ttl_seconds=callback_cache_ttl,
+    backend=cache.DiskCache(os.environ["DASHBOARD_CACHE_DIR"], ttl_seconds=callback_cache_ttl)
+    if os.environ.get("DASHBOARD_CACHE_DIR")
+    else None,
+    name="callbacks",
+)
+
+
+def memoize_callback(unordered: tuple[str, ...] = ()):
+    return cache.memoize(callback_cache, lambda: dataset_store.current.version, unordered)
+
+
+def get_section_data(data: dataset.Dataset, name: str, build):
+    """
+    Returns cached data or figure of a section, building it on first access
+    """
+    return section_cache.get_or_build(cache.make_key(name, data.version), build)
+
+
+# DATE RANGE
+# The date picker at the top limits every section. For the whole date range, sections use the data built
+# for the whole data set. For a shorter range, rows are one slice of the date-sorted data set, and sums
+# come from the sums per day (dm.DAILY_AGGREGATES), as the difference of two prefix sums
+date_range_id = "date-range"
+
 
+def get_rows(data: dataset.Dataset, start_date, end_date):
+    return data.data.iloc[data.date_index.row_slice(start_date, end_date)]
+
+
+def get_prefix_sums(data: dataset.Dataset, name: str):
+    keys, columns = dm.DAILY_AGGREGATES[name]
+    return get_section_data(
+        data, f"daily_{name}", lambda: di.build_prefix_sums(data.data, data.date_index, keys, columns)
+    )
 
-# Loaded the data
-df = pd.read_csv("data/supply_chain_dataset1.csv")
 
-# Clean data and prepare it for analysis
-df = dm.clean_data(df)
-df = dm.changing_columns_name_values(df)
+def get_range_sums(data: dataset.Dataset, name: str, start_date, end_date, by_month: bool = False):
+    return get_prefix_sums(data, name).range_sums(start_date, end_date, by_month)
 
-# Lists of unique IDs
-suppliers = dm.get_unique_supplier_id(df)
-warehouses = dm.get_unique_warehouse_id(df)
-regions = dm.get_unique_region(df)
+
+# Section data of the last few shorter date ranges, so another dropdown value in the same range
+# is answered from it instead of building it from the range sums again
+range_cache = cache.LRUCache(max_entries=16, name="date_ranges")
+
+
+def get_range_data(data: dataset.Dataset, name: str, start_date, end_date, build):
+    return range_cache.get_or_build(
+        cache.make_key(name, data.version, start_date=start_date, end_date=end_date), build
+    )
 
 # RQ1
 title_rq1 = "RQ1: How accurate is the forecast overall, and which products, locations, or promotions are causing the biggest errors?"
 text_rq1 = "This analysis explores how accurate the sales predictions are. It finds the biggest errors by product and location, and shows how promotions affect the results."
-df_rq1 = vis_rq1.prep_data(df)
-fig_rq1_line = vis_rq1.create_static_line_chart(df_rq1)
-fig_rq1_box = vis_rq1.create_promo_box_plot(df_rq1)
 rq1_plot_id = "rq1-plot"
+rq1_line_id = "rq1-line"
+rq1_box_id = "rq1-box"
+# longer histories are downsampled to this many points per line (LTTB)
+rq1_line_max_points = 1500
+
+
+def get_rq1_box_plot(data: dataset.Dataset):
+    return get_section_data(data, "rq1_box", lambda: vis_rq1.create_promo_box_plot(data.data, aggregate=True))
+
+
+def get_rq1_sales_forecast_series(data: dataset.Dataset):
+    # daily sales and forecast per warehouse/region pair as prefix sums, so the line chart of any
+    # dropdown pair and date range is one subtraction
+    return get_section_data(
+        data,
+        "rq1_sales_forecast_series",
+        lambda: vis_rq1.build_sales_forecast_series(get_prefix_sums(data, "sales_forecast")),
+    )
+
+
+def get_rq1_error_table(data: dataset.Dataset, start_date=None, end_date=None):
+    # summed forecast error per warehouse/region/product, so the bar chart callback is a lookup.
+    # Built from the running totals, which are updated with new rows only
+    if not data.date_index.covers_all(start_date, end_date):
+        return get_range_data(
+            data,
+            "rq1_error_table",
+            start_date,
+            end_date,
+            lambda: vis_rq1.build_forecast_error_table_from_sums(
+                get_range_sums(data, "forecast_error", start_date, end_date)[("abs_difference", "sum")]
+            ),
+        )
+    return get_section_data(
+        data,
+        "rq1_error_table",
+        lambda: vis_rq1.build_forecast_error_table_from_sums(
+            data.aggregates["forecast_error"][("abs_difference", "sum")]
+        ),
+    )
+
 
 # RQ2
 title_rq2 = """RQ2:  How do promotions impact sales volume/profitability? Is there a pattern - when the 
@@ -36,10 +147,43 @@ promotions are running or in which regions? How many product promotions are usua
 at the same time?"""
 text_rq2 = """This analysis examines how promotional campaigns affect average sales,
             profitability, and how promotions are distributed across regions."""
-df_rq2 = vis_rq2.prepare_promotion_data(df)
-fig_promo_sales = vis_rq2.plot_avg_units_sold(df_rq2)
-fig_promo_profit = vis_rq2.plot_avg_profit(df_rq2)
-fig_promo_region = vis_rq2.plot_promotions_by_region(df_rq2)
+rq2_sales_id = "rq2-sales"
+rq2_profit_id = "rq2-profit"
+rq2_region_id = "rq2-region"
+rq2_region_filter_id = "rq2-region-dropdown"
+rq2_warehouse_filter_id = "rq2-warehouse-dropdown"
+rq2_months_filter_id = "rq2-months-filter"
+rq2_concurrent_id = "rq2-concurrent"
+rq2_concurrent_distribution_id = "rq2-concurrent-distribution"
+
+
+def get_rq2_promotion_cube(data: dataset.Dataset, start_date=None, end_date=None):
+    # sums and counts per promotion flag, region, warehouse and month, so every RQ2 filter is
+    # answered from the cube. Built from the running totals, which are updated with new rows only
+    if not data.date_index.covers_all(start_date, end_date):
+        return get_range_data(
+            data,
+            "rq2_promotion_cube",
+            start_date,
+            end_date,
+            lambda: vis_rq2.build_promotion_cube(
+                get_range_sums(data, "promotions", start_date, end_date, by_month=True)
+            ),
+        )
+    return get_section_data(
+        data, "rq2_promotion_cube", lambda: vis_rq2.build_promotion_cube(data.aggregates["promotions"])
+    )
+
+
+def get_rq2_concurrent_promotions(data: dataset.Dataset):
+    # number of promotions running on each day, from promotion intervals per product and warehouse
+    return get_section_data(
+        data,
+        "rq2_concurrent_promotions",
+        lambda: vis_rq2.count_concurrent_promotions(
+            vis_rq2.get_promotion_intervals(data.data), data.data["date"].min(), data.data["date"].max()
+        ),
+    )
 
 # RQ3
 title_rq3 = """
@@ -60,6 +204,32 @@ rq3_table_id = "rq3-table"
 rq3_plot_id_3 = "rq3-scatter"
 
 
+def get_rq3_scatter(data: dataset.Dataset):
+    return get_section_data(data, "rq3_scatter", lambda: vis_rq3.plot_lead_time_vs_inventory(data.data))
+
+
+def get_rq3_lead_time_stats(data: dataset.Dataset, start_date=None, end_date=None):
+    # lead time statistics per supplier, from the running lead time histogram.
+    # The bar chart and table of any supplier selection are a lookup in it
+    if not data.date_index.covers_all(start_date, end_date):
+        return get_range_data(
+            data,
+            "rq3_lead_time_stats",
+            start_date,
+            end_date,
+            lambda: vis_rq3.build_lead_time_stats(
+                get_range_sums(data, "supplier_lead_time", start_date, end_date)[("supplier_lead_time_days", "count")]
+            ),
+        )
+    return get_section_data(
+        data,
+        "rq3_lead_time_stats",
+        lambda: vis_rq3.build_lead_time_stats(
+            data.aggregates["supplier_lead_time"][("supplier_lead_time_days", "count")]
+        ),
+    )
+
+
 # RQ4
 title_rq4 = """RQ4: Inventory/replenishment."""
 
@@ -70,6 +240,29 @@ text_rq4 = """ Are the inventory levels of products aligned with the sales deman
 rq4_plot_id = "rq4-plot"
 
 
+def get_rq4_inventory_index(data: dataset.Dataset):
+    # per product/warehouse time series, sorted once so each dropdown change is a dictionary lookup
+    return get_section_data(data, "rq4_inventory_index", lambda: vis_rq4.build_inventory_index(data.data))
+
+
+# RQ4 bar and scatter figures don't depend on the dropdowns - build them once per dataset version
+rq4_figure_cache = cache.LRUCache(max_entries=16, name="rq4_figures")
+
+
+def get_rq4_weeks_of_inventory_cover(data: dataset.Dataset):
+    return rq4_figure_cache.get_or_build(
+        cache.make_key("weeks_of_inventory_cover", data.version, top_n=20),
+        lambda: vis_rq4.plot_weeks_of_inventory_cover(data.data, top_n=20),
+    )
+
+
+def get_rq4_reorder_points(data: dataset.Dataset):
+    return rq4_figure_cache.get_or_build(
+        cache.make_key("reorder_point_vs_leadtime_demand", data.version, top_n=200),
+        lambda: vis_rq4.plot_reorder_point_vs_leadtime_demand(data.data, top_n=200),
+    )
+
+
 # RQ5
 title_rq5 = "RQ5: Sales performance of top products"
 text_rq5 = "This analysis explores how the demand for top selling products varies in different regions and months"
@@ -78,346 +271,588 @@ rq5_n_products_to_show = 5
 rq5_month_from = 1
 rq5_month_to = 12
 
-rq5_top_n_products = vis_rq5.get_top_n_products_sold(df, rq5_n_products_to_show)
-
-rq5_sq2_sale_performance_per_region_df = (
-    vis_rq5.get_sale_performance_for_products_across_regions(df, rq5_top_n_products, regions)
-)
 rq5_sq2_graph_id = "sale_across_regions_graph"
-rq5_sq2_graph_figure = vis_rq5.plot_sale_performance_for_products_across_regions(
-    rq5_sq2_sale_performance_per_region_df
-)
-
-rq5_sq3_demand_per_month_df = vis_rq5.get_demand_per_month(
-    df, rq5_top_n_products, rq5_month_from, rq5_month_to
-)
 rq5_sq3_demand_per_month_graph_id = "demand_over_time_graph"
-rq5_sq3_demand_per_month_graph_figure = vis_rq5.plot_demand_per_month(
-    rq5_sq3_demand_per_month_df
-)
+
+
+def get_rq5_sales_cube(data: dataset.Dataset, start_date=None, end_date=None):
+    # build the sales cube once, all RQ5 filters are answered from it.
+    # Built from the running totals, which are updated with new rows only
+    if not data.date_index.covers_all(start_date, end_date):
+        return get_range_data(
+            data,
+            "rq5_sales_cube",
+            start_date,
+            end_date,
+            lambda: vis_rq5.build_sales_cube_from_sums(
+                get_range_sums(data, "sales", start_date, end_date, by_month=True)[("units_sold", "sum")],
+                dm.get_unique_region(data.data),
+            ),
+        )
+    return get_section_data(
+        data,
+        "rq5_sales_cube",
+        lambda: vis_rq5.build_sales_cube_from_sums(
+            data.aggregates["sales"][("units_sold", "sum")], dm.get_unique_region(data.data)
+        ),
+    )
 
 
 # INITIALIZE DASH APP
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# compress=True sends responses gzip/brotli compressed (flask-compress);
+# numeric figure arrays are already sent base64 encoded by plotly
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], compress=True)
+serving.log_callback_payload_sizes(app.server)
+serving.add_refresh_endpoint(app.server, dataset_store)
+# callback latency, memory and response size per callback: /metrics (Prometheus) and /metrics/callbacks
+serving.add_metrics_endpoints(app.server)
 
-# LAYOUT
-app.layout = dbc.Container(
-    [
-        html.H1("Supply Chain Dashboard", className="text-center my-4"),
+# DASHBOARD_TRACE_MEMORY=1 records peak memory per callback (tracemalloc slows down every allocation)
+if os.environ.get("DASHBOARD_TRACE_MEMORY") == "1":
+    tracemalloc.start()
 
-        # ===================== RQ1 SECTION =====================
 
-        # Title
-        dbc.Row(
-            dbc.Col(html.H3(title_rq1, 
-                            className="text-center text-primary"), width=12),
-            className="mb-3"
-        ),
+# DASHBOARD_REFRESH_SECONDS=<n> checks for new data every n seconds and loads it in this process.
+# Only for a single process: under gunicorn the master checks and reloads all workers (see gunicorn.conf.py)
+def start_refresh_watcher():
+    if os.environ.get("DASHBOARD_REFRESH_SECONDS"):
+        dataset_store.watch(float(os.environ["DASHBOARD_REFRESH_SECONDS"]))
 
-        # Text Description
-        dbc.Row(
-            dbc.Col(html.P(text_rq1, 
-                           className="text-center lead"), width=12),
-            className="mb-4"
-        ),
 
-        # Line Chart
-        dbc.Row(
-            dbc.Col(dcc.Graph(figure=fig_rq1_line), width=12),
-            className="mb-5"
-        ),
+if os.environ.get("DASHBOARD_PRELOAD") != "1":
+    start_refresh_watcher()
 
-        # Filters
-        dbc.Row(
-            [
-                dbc.Col([
-                    html.Label("Select Warehouse:"),
-                    dcc.Dropdown(
-                        id="rq1-warehouse-dropdown",
-                        options=["All Warehouses"] + list(warehouses),
-                        value='All Warehouses',
-                        clearable=False
-                    )
-                ], width=6),
+# LAYOUT
+# The layout is built on every page load, so dropdown options include data loaded by a refresh
+def serve_layout():
+    df = dataset_store.current.data
+    date_index = dataset_store.current.date_index
+
+    # Lists of unique IDs
+    suppliers = dm.get_unique_supplier_id(df)
+    warehouses = dm.get_unique_warehouse_id(df)
+    regions = dm.get_unique_region(df)
+
+    return dbc.Container(
+        [
+            html.H1("Supply Chain Dashboard", className="text-center my-4"),
 
+            # Date range of all sections - without dates, the whole data set
+            dbc.Row(
                 dbc.Col([
-                    html.Label("Select Region:"),
-                    dcc.Dropdown(
-                        id="rq1-region-dropdown",
-                        options=["All Regions"] + list(regions),
-                        value='All Regions',
-                        clearable=False
+                    html.Label("Select Date Range:", className="me-2"),
+                    dcc.DatePickerRange(
+                        id=date_range_id,
+                        min_date_allowed=str(date_index.days[0]) if len(date_index.days) else None,
+                        max_date_allowed=str(date_index.days[-1]) if len(date_index.days) else None,
+                        minimum_nights=0,
+                        updatemode="bothdates",
+                        clearable=True
                     )
-                ], width=6),
-            ],
-            className="mb-5"
-        ),
+                ], width=12),
+                className="mb-4"
+            ),
 
-        # Dynamic Bar Chart
-        dbc.Row(
-            dbc.Col(html.H4("Top 10 Worst Performing SKUs"), width=12),
-            className="mb-3"
-        ),
-        dbc.Row(
-            dbc.Col(dcc.Graph(id="rq1-worst-performing-bar"), width=12),
-            className="mb-5"
-        ),
+            # ===================== RQ1 SECTION =====================
 
-        # Box Plot
-        dbc.Row(
-            dbc.Col(html.H4("Forecast Stability (Promotions)"), width=12),
-            className="mb-3"
-        ),
-        dbc.Row(
-            dbc.Col(dcc.Graph(figure=fig_rq1_box), width=12),
-            className="mb-4"
-        ),
+            # Title
+            dbc.Row(
+                dbc.Col(html.H3(title_rq1, 
+                                className="text-center text-primary"), width=12),
+                className="mb-3"
+            ),
 
-        #========================================================
+            # Text Description
+            dbc.Row(
+                dbc.Col(html.P(text_rq1, 
+                               className="text-center lead"), width=12),
+                className="mb-4"
+            ),
 
-        # ===================== RQ2 SECTION =====================
+            # Line Chart
+            dbc.Row(
+                dbc.Col(dcc.Loading(dcc.Graph(id=rq1_line_id)), width=12),
+                className="mb-5"
+            ),
 
-        html.Hr(),
-        # Title
-        dbc.Row(
-            dbc.Col(html.H3(title_rq2, className="text-center text-primary"), width=12),
-            className="mb-3"
-        ),
+            # Filters
+            dbc.Row(
+                [
+                    dbc.Col([
+                        html.Label("Select Warehouse:"),
+                        dcc.Dropdown(
+                            id="rq1-warehouse-dropdown",
+                            options=["All Warehouses"] + list(warehouses),
+                            value='All Warehouses',
+                            clearable=False
+                        )
+                    ], width=6),
 
-        # Text Description
-        dbc.Row(
-            dbc.Col(html.P(text_rq2, className="text-center lead"), width=12),
-            className="mb-4"
-        ),
-        dbc.Row(dbc.Col(dcc.Graph(figure=fig_promo_sales), width=12)),
-        dbc.Row(dbc.Col(dcc.Graph(figure=fig_promo_profit), width=12)),
-        dbc.Row(dbc.Col(dcc.Graph(figure=fig_promo_region), width=12)),
-
-        #========================================================
-
-        # ===================== RQ3 SECTION =====================
-        html.Hr(),
-        # Title
-        dbc.Row(
-            dbc.Col(html.H3(title_rq3, className="text-center text-primary"), width=12),
-            className="mb-3"
-        ),
+                    dbc.Col([
+                        html.Label("Select Region:"),
+                        dcc.Dropdown(
+                            id="rq1-region-dropdown",
+                            options=["All Regions"] + list(regions),
+                            value='All Regions',
+                            clearable=False
+                        )
+                    ], width=6),
+                ],
+                className="mb-5"
+            ),
 
-        # Text Description
-        dbc.Row(
-            dbc.Col(html.P(text_rq3, className="text-center lead"), width=12),
-            className="mb-4"
-        ),
+            # Dynamic Bar Chart
+            dbc.Row(
+                dbc.Col(html.H4("Top 10 Worst Performing SKUs"), width=12),
+                className="mb-3"
+            ),
+            dbc.Row(
+                dbc.Col(dcc.Loading(dcc.Graph(id="rq1-worst-performing-bar")), width=12),
+                className="mb-5"
+            ),
 
-        # Dropdown and Bar chart
-        dbc.Row(
-        [
-            dbc.Col(
-                dbc.Card(
-                    [
-                        dbc.CardHeader("Select Supplier(s)"),
-                        dbc.CardBody(
-                            dcc.Dropdown(
-                                id="rq3-supplier-dropdown",
-                                options=[{"label": str(s), "value": s} for s in suppliers],
-                                multi=True,
-                                placeholder="Select supplier(s)"
-                            )
+            # Box Plot
+            dbc.Row(
+                dbc.Col(html.H4("Forecast Stability (Promotions)"), width=12),
+                className="mb-3"
+            ),
+            dbc.Row(
+                dbc.Col(dcc.Loading(dcc.Graph(id=rq1_box_id)), width=12),
+                className="mb-4"
+            ),
+
+            #========================================================
+
+            # ===================== RQ2 SECTION =====================
+
+            html.Hr(),
+            # Title
+            dbc.Row(
+                dbc.Col(html.H3(title_rq2, className="text-center text-primary"), width=12),
+                className="mb-3"
+            ),
+
+            # Text Description
+            dbc.Row(
+                dbc.Col(html.P(text_rq2, className="text-center lead"), width=12),
+                className="mb-4"
+            ),
+
+            # Filters
+            dbc.Row(
+                [
+                    dbc.Col([
+                        html.Label("Select Region(s):"),
+                        dcc.Dropdown(
+                            id=rq2_region_filter_id,
+                            options=list(regions),
+                            multi=True,
+                            placeholder="All Regions"
                         )
-                    ]
-                ),
-                width=2
+                    ], width=3),
+
+                    dbc.Col([
+                        html.Label("Select Warehouse(s):"),
+                        dcc.Dropdown(
+                            id=rq2_warehouse_filter_id,
+                            options=list(warehouses),
+                            multi=True,
+                            placeholder="All Warehouses"
+                        )
+                    ], width=3),
+
+                    dbc.Col([
+                        html.Label("Select Months:"),
+                        vis_rq5.get_month_range_filter_selector(1, 12, rq2_months_filter_id)
+                    ], width=6),
+                ],
+                className="mb-4"
+            ),
+            dbc.Row(dbc.Col(dcc.Loading(dcc.Graph(id=rq2_sales_id)), width=12)),
+            dbc.Row(dbc.Col(dcc.Loading(dcc.Graph(id=rq2_profit_id)), width=12)),
+            dbc.Row(dbc.Col(dcc.Loading(dcc.Graph(id=rq2_region_id)), width=12)),
+
+            # Promotions running at the same time
+            dbc.Row(
+                [
+                    dbc.Col(dcc.Loading(dcc.Graph(id=rq2_concurrent_id)), width=8),
+                    dbc.Col(dcc.Loading(dcc.Graph(id=rq2_concurrent_distribution_id)), width=4),
+                ]
             ),
-            dbc.Col(
-                dcc.Graph(id=rq3_plot_id_1),width=10),
-            ],
-            className="mb-4"
-        ),
 
-        # Box plot
-        dbc.Row(dbc.Col(dcc.Graph(id=rq3_plot_id_2), className="mb-3",width=12)),
+            #========================================================
 
-        # Summary table
-        dbc.Row(
-            dbc.Col(
-                dbc.Card(
-                    dbc.CardBody(
+            # ===================== RQ3 SECTION =====================
+            html.Hr(),
+            # Title
+            dbc.Row(
+                dbc.Col(html.H3(title_rq3, className="text-center text-primary"), width=12),
+                className="mb-3"
+            ),
+
+            # Text Description
+            dbc.Row(
+                dbc.Col(html.P(text_rq3, className="text-center lead"), width=12),
+                className="mb-4"
+            ),
+
+            # Dropdown and Bar chart
+            dbc.Row(
+            [
+                dbc.Col(
+                    dbc.Card(
                         [
-                            html.B("Supplier Summary Table",className="fw-bold text-center mb-2"),
-                            html.Div(id=rq3_table_id,style={"overflowX": "auto"})
+                            dbc.CardHeader("Select Supplier(s)"),
+                            dbc.CardBody(
+                                dcc.Dropdown(
+                                    id="rq3-supplier-dropdown",
+                                    options=[{"label": str(s), "value": s} for s in suppliers],
+                                    multi=True,
+                                    placeholder="Select supplier(s)"
+                                )
+                            )
                         ]
-                    )
+                    ),
+                    width=2
                 ),
-                width=12
+                dbc.Col(
+                    dcc.Graph(id=rq3_plot_id_1),width=10),
+                ],
+                className="mb-4"
             ),
-            className="my-4"
-        ),
 
-        # Scatter plot
-        dbc.Row(dbc.Col(dcc.Graph(id=rq3_plot_id_3, figure=vis_rq3.plot_lead_time_vs_inventory(df)),width=12),
-            className="mb-4"
-        ),
-
-        #========================================================
-        # ===================== RQ4 SECTION =====================
-
-        html.Hr(),
-        dbc.Row(dbc.Col(html.H2(title_rq4, className="text-center text-primary mt-3"))),
-        dbc.Row(dbc.Col(html.P(text_rq4, className="text-center lead"))),
+            # Box plot
+            dbc.Row(dbc.Col(dcc.Graph(id=rq3_plot_id_2), className="mb-3",width=12)),
 
-        # Product & Warehouse dropdown part
-        dbc.Row(
-            [
+            # Summary table
+            dbc.Row(
                 dbc.Col(
-                    [
-                        html.Label("Select Product:"),
-                        dcc.Dropdown(
-                            id="rq4-sku-dropdown",
-                            options=[
-                                {"label": str(p), "value": p}
-                                for p in sorted(df["product_id"].dropna().unique())
-                            ],
-                            value=sorted(df["product_id"].dropna().unique())[0],
-                            clearable=False,
+                    dbc.Card(
+                        dbc.CardBody(
+                            [
+                                html.B("Supplier Summary Table",className="fw-bold text-center mb-2"),
+                                html.Div(id=rq3_table_id,style={"overflowX": "auto"})
+                            ]
                         )
-                    ],
-                    width=6
+                    ),
+                    width=12
                 ),
+                className="my-4"
+            ),
+
+            # Scatter plot
+            dbc.Row(dbc.Col(dcc.Loading(dcc.Graph(id=rq3_plot_id_3)),width=12),
+                className="mb-4"
+            ),
+
+            #========================================================
+            # ===================== RQ4 SECTION =====================
+
+            html.Hr(),
+            dbc.Row(dbc.Col(html.H2(title_rq4, className="text-center text-primary mt-3"))),
+            dbc.Row(dbc.Col(html.P(text_rq4, className="text-center lead"))),
+
+            # Product & Warehouse dropdown part
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            html.Label("Select Product:"),
+                            dcc.Dropdown(
+                                id="rq4-sku-dropdown",
+                                options=[
+                                    {"label": str(p), "value": p}
+                                    for p in sorted(df["product_id"].dropna().unique())
+                                ],
+                                value=sorted(df["product_id"].dropna().unique())[0],
+                                clearable=False,
+                            )
+                        ],
+                        width=6
+                    ),
+                    dbc.Col(
+                        [
+                            html.Label("Select Warehouse:"),
+                            dcc.Dropdown(
+                                id="rq4-warehouse-dropdown",
+                                options=[
+                                    {"label": str(w), "value": w}
+                                    for w in sorted(df["warehouse_id"].dropna().unique())
+                                ],
+                                value=sorted(df["warehouse_id"].dropna().unique())[0],
+                                clearable=False
+                            )
+                        ],
+                        width=6
+                    )
+                ],
+                className="mb-4"
+            ),
+
+            dbc.Row(dbc.Col(dcc.Graph(id="rq4-sawplot"), width=12), className="mb-4"),
+            dbc.Row(dbc.Col(dcc.Graph(id="rq4-bars"), width=12), className="mb-4"),
+            dbc.Row(dbc.Col(dcc.Graph(id="rq4-scatter"), width=12), className="mb-4"),
+
+            # ===================== RQ5 SECTION =====================
+            html.Hr(),
+            dbc.Row(dbc.Col(html.H2(title_rq5, className="text-center text-primary mt-3"))),
+            dbc.Row(dbc.Col(html.P(text_rq5, className="text-center lead"))),
+
+            # Filters
+            dbc.Row(
                 dbc.Col(
-                    [
-                        html.Label("Select Warehouse:"),
-                        dcc.Dropdown(
-                            id="rq4-warehouse-dropdown",
-                            options=[
-                                {"label": str(w), "value": w}
-                                for w in sorted(df["warehouse_id"].dropna().unique())
-                            ],
-                            value=sorted(df["warehouse_id"].dropna().unique())[0],
-                            clearable=False
-                        )
-                    ],
-                    width=6
+                    html.H3("Filters", className="text-center text-primary"),
+                    width=12
                 )
-            ],
-            className="mb-4"
-        ),
-
-        dbc.Row(dbc.Col(dcc.Graph(id="rq4-sawplot"), width=12), className="mb-4"),
-        dbc.Row(dbc.Col(dcc.Graph(id="rq4-bars"), width=12), className="mb-4"),
-        dbc.Row(dbc.Col(dcc.Graph(id="rq4-scatter"), width=12), className="mb-4"),
-
-        # ===================== RQ5 SECTION =====================
-        html.Hr(),
-        dbc.Row(dbc.Col(html.H2(title_rq5, className="text-center text-primary mt-3"))),
-        dbc.Row(dbc.Col(html.P(text_rq5, className="text-center lead"))),
-
-        # Filters
-        dbc.Row(
-            dbc.Col(
-                html.H3("Filters", className="text-center text-primary"),
-                width=12
-            )
-        ),
-        dbc.Row(
-            dbc.Col(html.Label("Number of top products to show"), width=12, className="text-center mb-3")
-        ),
-        dbc.Row(
-            dbc.Col(
-                vis_rq5.get_number_of_products_filter_selector(
-                    rq5_n_products_to_show
+            ),
+            dbc.Row(
+                dbc.Col(html.Label("Number of top products to show"), width=12, className="text-center mb-3")
+            ),
+            dbc.Row(
+                dbc.Col(
+                    vis_rq5.get_number_of_products_filter_selector(
+                        rq5_n_products_to_show
+                    ),
+                    width=3,
+                    className="mx-auto"
                 ),
-                width=3,
-                className="mx-auto"
+                className="mb-5",
             ),
-            className="mb-5",
-        ),
 
-        # Sales performance across regions
-        dbc.Row(
-            dbc.Col(
-                html.H3(
-                    "How does sales performance for the top products vary across different regions?",
-                    className="text-center text-primary",
+            # Sales performance across regions
+            dbc.Row(
+                dbc.Col(
+                    html.H3(
+                        "How does sales performance for the top products vary across different regions?",
+                        className="text-center text-primary",
+                    ),
+                    width=12,
                 ),
-                width=12,
+                className="mb-3",
             ),
-            className="mb-3",
-        ),
-        dbc.Row(
-            dbc.Col(
-                dcc.Graph(id=rq5_sq2_graph_id, figure=rq5_sq2_graph_figure),
-                width=12
+            dbc.Row(
+                dbc.Col(
+                    dcc.Loading(dcc.Graph(id=rq5_sq2_graph_id)),
+                    width=12
+                ),
+                className="mb-5",
             ),
-            className="mb-5",
-        ),
-        # Demand change over period of time
-        dbc.Row(
-            dbc.Col(
-                html.H3(
-                    "Does the demand for top products change over time, and are there noticeable sales peaks?",
-                    className="text-center text-primary",
+            # Demand change over period of time
+            dbc.Row(
+                dbc.Col(
+                    html.H3(
+                        "Does the demand for top products change over time, and are there noticeable sales peaks?",
+                        className="text-center text-primary",
+                    ),
+                    width=12,
                 ),
-                width=12,
+                className="mb-3",
             ),
-            className="mb-3",
-        ),
-        # Date filter only applied for this question
-        dbc.Row(dbc.Col(html.Label("Month range"), width=12, className="text-center mb-3")),
-        dbc.Row(
-            dbc.Col(
-                vis_rq5.get_month_range_filter_selector(
-                    rq5_month_from, rq5_month_to
+            # Date filter only applied for this question
+            dbc.Row(dbc.Col(html.Label("Month range"), width=12, className="text-center mb-3")),
+            dbc.Row(
+                dbc.Col(
+                    vis_rq5.get_month_range_filter_selector(
+                        rq5_month_from, rq5_month_to
+                    ),
+                    width=6,
+                    className="mx-auto"
                 ),
-                width=6,
-                className="mx-auto"
+                className="mb-3",
             ),
-            className="mb-3",
-        ),
-        dbc.Row(
-            dbc.Col(
-                dcc.Graph(
-                    id=rq5_sq3_demand_per_month_graph_id,
-                    figure=rq5_sq3_demand_per_month_graph_figure,
+            dbc.Row(
+                dbc.Col(
+                    dcc.Loading(dcc.Graph(id=rq5_sq3_demand_per_month_graph_id)),
+                    width=12
                 ),
-                width=12
             ),
-        ),
-        #========================================================
-    ],
-    fluid=True
+            #========================================================
+        ],
+        fluid=True
+    )
+
+
+app.layout = serve_layout
+
+#CALLBACK (date range) - a typed range that ends before it starts is put in order, so sections never get one
+@app.callback(
+    Output(date_range_id, "start_date"),
+    Output(date_range_id, "end_date"),
+    Input(date_range_id, "start_date"),
+    Input(date_range_id, "end_date")
 )
+def order_date_range(start_date, end_date):
+    # dates are ISO strings, optionally with a time after the day
+    if start_date and end_date and end_date[:10] < start_date[:10]:
+        return end_date, start_date
+    return dash.no_update, dash.no_update
+
+#CALLBACK (RQ1) - promotion box plot, for the date range
+@app.callback(
+    Output(rq1_box_id, "figure"),
+    Input(date_range_id, "start_date"),
+    Input(date_range_id, "end_date")
+)
+@instrumentation.instrument
+@memoize_callback()
+def load_rq1_box_plot(start_date, end_date):
+    data = dataset_store.current
+    if data.date_index.is_empty(start_date, end_date):
+        return figures.plot_no_data("Distribution of Forecast Errors (Bias)")
+    if not data.date_index.covers_all(start_date, end_date):
+        return vis_rq1.create_promo_box_plot(get_rows(data, start_date, end_date), aggregate=True)
+
+    return get_rq1_box_plot(data)
+
+#CALLBACK (RQ1) - sales vs forecast of the selected warehouse and region
+@app.callback(
+    Output(rq1_line_id, "figure"),
+    [Input('rq1-warehouse-dropdown', "value"),
+     Input('rq1-region-dropdown', "value"),
+     Input(date_range_id, "start_date"),
+     Input(date_range_id, "end_date")]
+)
+@instrumentation.instrument
+@memoize_callback()
+def update_rq1_line_chart(warehouse_id, region_id, start_date, end_date):
+    with instrumentation.phase("data"):
+        df_daily = vis_rq1.get_sales_vs_forecast(
+            get_rq1_sales_forecast_series(dataset_store.current), warehouse_id, region_id, start_date, end_date
+        )
+
+    with instrumentation.phase("figure"):
+        if (warehouse_id, region_id) == ("All Warehouses", "All Regions"):
+            title = "Total Company Sales vs. Demand Forecast"
+        else:
+            title = f"Sales vs. Demand Forecast – {warehouse_id}, {region_id}"
+        fig_line = vis_rq1.plot_sales_vs_forecast(df_daily, title=title, max_points=rq1_line_max_points)
+    return fig_line
 
 #CALLBACK (RQ1)
 @app.callback(
     Output("rq1-worst-performing-bar", "figure"),
     [Input('rq1-warehouse-dropdown', "value"),
-     Input('rq1-region-dropdown', "value")]
+     Input('rq1-region-dropdown', "value"),
+     Input(date_range_id, "start_date"),
+     Input(date_range_id, "end_date")]
 )
-def update_rq1_bar_chart(warehouse_id, region_id):
+@instrumentation.instrument
+@memoize_callback()
+def update_rq1_bar_chart(warehouse_id, region_id, start_date, end_date):
 
-    df_filtered = vis_rq1.filter_dataframe(df_rq1, warehouse_id, region_id)
+    with instrumentation.phase("data"):
+        df_ranked = vis_rq1.get_worst_performing(
+            get_rq1_error_table(dataset_store.current, start_date, end_date), warehouse_id, region_id
+        )
 
-    fig_sku = vis_rq1.create_worst_performing_chart(df_filtered)
+    with instrumentation.phase("figure"):
+        fig_sku = vis_rq1.plot_worst_performing(df_ranked)
 
     return fig_sku
 
+# CALLBACK (RQ2)
+@app.callback(
+    Output(rq2_sales_id, "figure"),
+    Output(rq2_profit_id, "figure"),
+    Output(rq2_region_id, "figure"),
+    Input(rq2_region_filter_id, "value"),
+    Input(rq2_warehouse_filter_id, "value"),
+    Input(rq2_months_filter_id, "value"),
+    Input(date_range_id, "start_date"),
+    Input(date_range_id, "end_date")
+)
+@instrumentation.instrument
+@memoize_callback(unordered=("regions", "warehouses"))
+def update_rq2(regions, warehouses, month_range, start_date, end_date):
+    with instrumentation.phase("data"):
+        promotion_cube = get_rq2_promotion_cube(dataset_store.current, start_date, end_date)
+        selected = vis_rq2.select_promotions(promotion_cube, regions, warehouses, month_range[0], month_range[1])
+        averages = vis_rq2.get_promotion_averages(selected)
+        region_promos = vis_rq2.get_promotions_by_region(promotion_cube, selected)
+
+    with instrumentation.phase("figure"):
+        fig_sales = vis_rq2.plot_avg_units_sold_from_averages(averages)
+        fig_profit = vis_rq2.plot_avg_profit_from_averages(averages)
+        fig_region = vis_rq2.plot_promotions_by_region_from_counts(region_promos)
+    return fig_sales, fig_profit, fig_region
+
+# CALLBACK (RQ2) - concurrent promotions figures, for the date range
+@app.callback(
+    Output(rq2_concurrent_id, "figure"),
+    Output(rq2_concurrent_distribution_id, "figure"),
+    Input(date_range_id, "start_date"),
+    Input(date_range_id, "end_date")
+)
+@instrumentation.instrument
+@memoize_callback()
+def load_rq2_concurrent_promotions(start_date, end_date):
+    data = dataset_store.current
+    daily = get_rq2_concurrent_promotions(data)
+    if not data.date_index.covers_all(start_date, end_date):
+        daily = daily.iloc[di.slice_sorted(daily["date"].to_numpy(), start_date, end_date)]
+        return (
+            vis_rq2.plot_concurrent_promotions(daily),
+            vis_rq2.plot_concurrent_promotions_distribution(vis_rq2.get_concurrent_promotions_distribution(daily)),
+        )
+
+    fig_daily = get_section_data(data, "rq2_concurrent", lambda: vis_rq2.plot_concurrent_promotions(daily))
+    fig_distribution = get_section_data(
+        data,
+        "rq2_concurrent_distribution",
+        lambda: vis_rq2.plot_concurrent_promotions_distribution(
+            vis_rq2.get_concurrent_promotions_distribution(daily)
+        ),
+    )
+    return fig_daily, fig_distribution
+
+# CALLBACK (RQ3) - scatter plot, for the date range
+@app.callback(
+    Output(rq3_plot_id_3, "figure"),
+    Input(date_range_id, "start_date"),
+    Input(date_range_id, "end_date")
+)
+@instrumentation.instrument
+@memoize_callback()
+def load_rq3_scatter(start_date, end_date):
+    data = dataset_store.current
+    if data.date_index.is_empty(start_date, end_date):
+        return figures.plot_no_data("<b>Average Lead Time vs Inventory Level</b>")
+    if not data.date_index.covers_all(start_date, end_date):
+        return vis_rq3.plot_lead_time_vs_inventory(get_rows(data, start_date, end_date))
+    return get_rq3_scatter(data)
+
 # CALLBACK (RQ3)
 @app.callback(
     Output(rq3_plot_id_1, "figure"),
     Output(rq3_plot_id_2, "figure"),
     Output(rq3_table_id, "children"),
-    Input("rq3-supplier-dropdown", "value")
+    Input("rq3-supplier-dropdown", "value"),
+    Input(date_range_id, "start_date"),
+    Input(date_range_id, "end_date")
 )
-def update_rq3(selected_suppliers):
-    if selected_suppliers:
-        filtered_df = df[df["supplier_id"].isin(selected_suppliers)]
-    else:
-        filtered_df = df
-
-    fig_bar = vis_rq3.plot_avg_lead_time(filtered_df)
-    fig_box = vis_rq3.plot_lead_time_box(filtered_df)
-    summary_df = vis_rq3.supplier_summary_table(filtered_df)
-    table = dbc.Table.from_dataframe(summary_df, striped=True, bordered=True, hover=True, responsive=True)
+@instrumentation.instrument
+@memoize_callback(unordered=("selected_suppliers",))
+def update_rq3(selected_suppliers, start_date, end_date):
+    data = dataset_store.current
+    with instrumentation.phase("data"):
+        df = get_rows(data, start_date, end_date)
+        if selected_suppliers:
+            filtered_df = df[df["supplier_id"].isin(selected_suppliers)]
+        else:
+            filtered_df = df
+
+        stats = vis_rq3.select_suppliers(get_rq3_lead_time_stats(data, start_date, end_date), selected_suppliers)
+
+    # the box plot statistics are computed while building the figure (figures.compute_box_stats)
+    with instrumentation.phase("figure"):
+        if df.empty:
+            fig_bar = figures.plot_no_data("<b>Average Lead Time by Supplier</b>")
+            fig_box = figures.plot_no_data("<b>Lead Time Distribution by Supplier</b>")
+        else:
+            fig_bar = vis_rq3.plot_avg_lead_time_from_stats(stats)
+            fig_box = vis_rq3.plot_lead_time_box(filtered_df, aggregate=True)
+        summary_df = vis_rq3.supplier_summary_table_from_stats(stats)
+        table = dbc.Table.from_dataframe(summary_df, striped=True, bordered=True, hover=True, responsive=True)
     return fig_bar, fig_box, table
 
 #CALLBACK (Rq-4)
@@ -426,12 +861,30 @@ def update_rq3(selected_suppliers):
     Output("rq4-bars", "figure"),
     Output("rq4-scatter", "figure"),
     Input("rq4-sku-dropdown", "value"),
-    Input("rq4-warehouse-dropdown", "value")
+    Input("rq4-warehouse-dropdown", "value"),
+    Input(date_range_id, "start_date"),
+    Input(date_range_id, "end_date")
 )
-def update_rq4(product_id, warehouse_id):
-    fig_saw = vis_rq4.plot_inventory_vs_sales_time(df, product_id, warehouse_id)
-    fig_bars = vis_rq4.plot_weeks_of_inventory_cover(df, top_n=20)
-    fig_scatter = vis_rq4.plot_reorder_point_vs_leadtime_demand(df, top_n=200)
+@instrumentation.instrument
+@memoize_callback()
+def update_rq4(product_id, warehouse_id, start_date, end_date):
+    data = dataset_store.current
+    with instrumentation.phase("data"):
+        inventory_index = get_rq4_inventory_index(data)
+        covers_all = data.date_index.covers_all(start_date, end_date)
+        rows = data.data if covers_all else get_rows(data, start_date, end_date)
+
+    with instrumentation.phase("figure"):
+        fig_saw = vis_rq4.plot_inventory_vs_sales_time(
+            rows, product_id, warehouse_id, index=inventory_index,
+            start_date=None if covers_all else start_date, end_date=None if covers_all else end_date
+        )
+        if covers_all:
+            fig_bars = get_rq4_weeks_of_inventory_cover(data)
+            fig_scatter = get_rq4_reorder_points(data)
+        else:
+            fig_bars = vis_rq4.plot_weeks_of_inventory_cover(rows, top_n=20)
+            fig_scatter = vis_rq4.plot_reorder_point_vs_leadtime_demand(rows, top_n=200)
     return fig_saw, fig_bars, fig_scatter
 
 
@@ -439,44 +892,126 @@ def update_rq4(product_id, warehouse_id):
 
 # CALLBACK (RQ5)
 @app.callback(
-    Output(rq5_sq2_graph_id, "figure"), [Input("rq5_top_products_filter", "value")]
+    Output(rq5_sq2_graph_id, "figure"),
+    [Input("rq5_top_products_filter", "value"),
+     Input(date_range_id, "start_date"),
+     Input(date_range_id, "end_date")]
 )
-def rq5_update_sales_per_region_chart(number_of_products_to_show):
-    # filter dataset for new number of products
-    products_to_plot = vis_rq5.get_top_n_products_sold(df, number_of_products_to_show)
-
-    # create data structure for products included
-    products_to_plot_df = vis_rq5.get_sale_performance_for_products_across_regions(
-        df, products_to_plot, regions
-    )
+@instrumentation.instrument
+@memoize_callback()
+def rq5_update_sales_per_region_chart(number_of_products_to_show, start_date, end_date):
+    with instrumentation.phase("data"):
+        # filter dataset for new number of products
+        sales_cube = get_rq5_sales_cube(dataset_store.current, start_date, end_date)
+        products_to_plot = vis_rq5.get_top_n_products_sold_from_cube(sales_cube, number_of_products_to_show)
+
+        # create data structure for products included
+        products_to_plot_df = vis_rq5.get_sale_performance_for_products_across_regions_from_cube(
+            sales_cube, products_to_plot
+        )
 
     # create figure from data structure
-    new_graph = vis_rq5.plot_sale_performance_for_products_across_regions(
-        products_to_plot_df
-    )
+    with instrumentation.phase("figure"):
+        new_graph = vis_rq5.plot_sale_performance_for_products_across_regions(
+            products_to_plot_df
+        )
     return new_graph
 
 # update performance per month
 @app.callback(
     Output(rq5_sq3_demand_per_month_graph_id, "figure"),
-    [Input("rq5_top_products_filter", "value"), Input("rq5_months_filter", "value")],
+    [Input("rq5_top_products_filter", "value"),
+     Input("rq5_months_filter", "value"),
+     Input(date_range_id, "start_date"),
+     Input(date_range_id, "end_date")],
 )
-def rq5_update_sales_per_month_graph(number_of_products_to_show, month_range):
+@instrumentation.instrument
+@memoize_callback()
+def rq5_update_sales_per_month_graph(number_of_products_to_show, month_range, start_date, end_date):
     month_from = month_range[0]
     month_to = month_range[1]
 
-    # filter dataset for new number of products and month range
-    products_to_plot = vis_rq5.get_top_n_products_sold(df, number_of_products_to_show)
+    with instrumentation.phase("data"):
+        # filter dataset for new number of products and month range
+        sales_cube = get_rq5_sales_cube(dataset_store.current, start_date, end_date)
+        products_to_plot = vis_rq5.get_top_n_products_sold_from_cube(sales_cube, number_of_products_to_show)
 
-    # create data structure for products included
-    products_to_plot_df = vis_rq5.get_demand_per_month(
-        df, products_to_plot, month_from, month_to
-    )
+        # create data structure for products included
+        products_to_plot_df = vis_rq5.get_demand_per_month_from_cube(
+            sales_cube, products_to_plot, month_from, month_to
+        )
 
     # create figure from data structure
-    new_graph = vis_rq5.plot_demand_per_month(products_to_plot_df)
+    with instrumentation.phase("figure"):
+        new_graph = vis_rq5.plot_demand_per_month(products_to_plot_df)
     return new_graph
 
+
+profiling.mark_phase("create app")
+
+
+# Section data and static figures built by build_all_sections, as tasks of the precompute pipeline.
+# Each task stores what a worker process built in the cache its getter reads
+def get_precompute_tasks(data: dataset.Dataset) -> list[precompute.Task]:
+    def task(name, build, depends_on=(), target_cache=section_cache, key=None):
+        key = key or cache.make_key(name, data.version)
+        return precompute.Task(name, build, lambda value: target_cache.set(key, value), depends_on)
+
+    return [
+        task("rq1_error_table", lambda: get_rq1_error_table(data)),
+        task("rq1_box", lambda: get_rq1_box_plot(data)),
+        task(
+            "rq1_sales_forecast_series",
+            lambda: get_rq1_sales_forecast_series(data),
+            depends_on=("daily_sales_forecast",),
+        ),
+        task("rq2_promotion_cube", lambda: get_rq2_promotion_cube(data)),
+        task("rq2_concurrent_promotions", lambda: get_rq2_concurrent_promotions(data)),
+        task("rq3_lead_time_stats", lambda: get_rq3_lead_time_stats(data)),
+        task("rq3_scatter", lambda: get_rq3_scatter(data)),
+        task("rq4_inventory_index", lambda: get_rq4_inventory_index(data)),
+        task(
+            "rq4_weeks_of_inventory_cover",
+            lambda: get_rq4_weeks_of_inventory_cover(data),
+            target_cache=rq4_figure_cache,
+            key=cache.make_key("weeks_of_inventory_cover", data.version, top_n=20),
+        ),
+        task(
+            "rq4_reorder_points",
+            lambda: get_rq4_reorder_points(data),
+            target_cache=rq4_figure_cache,
+            key=cache.make_key("reorder_point_vs_leadtime_demand", data.version, top_n=200),
+        ),
+        task("rq5_sales_cube", lambda: get_rq5_sales_cube(data)),
+    ] + [
+        task(f"daily_{name}", lambda name=name: get_prefix_sums(data, name)) for name in dm.DAILY_AGGREGATES
+    ]
+
+
+# Builds the data of every section now instead of on first access.
+# Used when the app is preloaded before forking workers (see gunicorn.conf.py), so all workers
+# share the one copy built here instead of each building their own.
+# Independent sections are built at the same time on DASHBOARD_PRECOMPUTE_WORKERS workers (default: one per CPU),
+# threads or forked processes (DASHBOARD_PRECOMPUTE_EXECUTOR=thread|process, default thread)
+def build_all_sections():
+    return precompute.run_tasks(
+        get_precompute_tasks(dataset_store.current),
+        max_workers=int(os.environ.get("DASHBOARD_PRECOMPUTE_WORKERS", 0)) or None,
+        executor=os.environ.get("DASHBOARD_PRECOMPUTE_EXECUTOR", "thread"),
+    )
+
+
+if os.environ.get("DASHBOARD_PRELOAD") == "1":
+    build_all_sections()
+    profiling.mark_phase("build sections")
+
+# WSGI entry point for gunicorn (main:server)
+server = app.server
+
+# DASHBOARD_PROFILE_STARTUP=1 logs the time of each phase above (python -m analysis.profiling)
+profiling.log_phases()
+
 # RUN APP
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     app.run(debug=True)